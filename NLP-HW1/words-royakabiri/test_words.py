@@ -1,3 +1,5 @@
+import os
+
 import pytest
 
 import numpy as np
@@ -66,6 +68,64 @@ def test_most_common_ing_words():
     ]
 
 
+def test_most_common_streaming():
+    # tiny chunks split many tokens across chunk boundaries
+    for word_regex, pos_regex in [(".*", ".*"), (".*", None), (None, "n.*")]:
+        assert words.most_common("brown_sample.txt",
+                                 word_regex=word_regex,
+                                 pos_regex=pos_regex,
+                                 n=20,
+                                 chunk_size=7) == \
+            words.most_common("brown_sample.txt",
+                              word_regex=word_regex,
+                              pos_regex=pos_regex,
+                              n=20)
+
+
+def test_most_common_files(tmp_path):
+    # split the sample into shards at token boundaries
+    with open("brown_sample.txt") as in_file:
+        tokens = in_file.read().split()
+    shard_size = len(tokens) // 3 + 1
+    for i in range(3):
+        shard_tokens = tokens[i * shard_size:(i + 1) * shard_size]
+        (tmp_path / "shard{}.txt".format(i)).write_text(" ".join(shard_tokens))
+
+    shards = str(tmp_path / "shard*.txt")
+    for word_regex, pos_regex in [(".*", ".*"), (".*", None), (None, ".*")]:
+        assert words.most_common_files(shards,
+                                       word_regex=word_regex,
+                                       pos_regex=pos_regex,
+                                       n=10,
+                                       processes=2) == \
+            words.most_common("brown_sample.txt",
+                              word_regex=word_regex,
+                              pos_regex=pos_regex,
+                              n=10)
+
+
+def test_word_pos_index(tmp_path):
+    word_pos_path = str(tmp_path / "brown_sample.txt")
+    with open("brown_sample.txt") as in_file, open(word_pos_path, "w") as out_file:
+        out_file.write(in_file.read())
+
+    index = words.WordPosIndex(word_pos_path)
+    assert os.path.exists(word_pos_path + ".index")
+    for word_regex, pos_regex in [(".*", ".*"), (".*ing$", ".*"),
+                                  (".*", None), (None, "vb.*"), (None, None)]:
+        assert index.most_common(word_regex, pos_regex, n=10) == \
+            words.most_common(word_pos_path, word_regex, pos_regex, n=10)
+
+    # the saved index is reused until the tagged file changes
+    assert words.WordPosIndex(word_pos_path).tokenCounts == index.tokenCounts
+    with open(word_pos_path, "a") as out_file:
+        out_file.write(" zebra/nn zebra/nn")
+    index = words.WordPosIndex(word_pos_path)
+    assert index.most_common(".*", None, n=10) == \
+        words.most_common(word_pos_path, ".*", None, n=10)
+    assert index.tokenCounts["zebra/nn"] == 2
+
+
 def test_most_similar_to_house():
     wv = words.WordVectors("vectors_top3000.txt")
     assert wv.most_similar("house", 3) == [
@@ -92,3 +152,188 @@ def test_average():
     assert isinstance(average_vector, np.ndarray)
     assert average_vector[:5] == pytest.approx(np.array([
         -0.110, -0.018, 0.173, 0.055, 0.096]), abs=1e-3)
+
+
+@pytest.fixture
+def vectors_path(tmp_path):
+    # a small random vocabulary, with a few words sharing a direction
+    rng = np.random.RandomState(42)
+    vectors = rng.normal(size=(500, 20))
+    vectors[1] = 2 * vectors[0] + 0.01
+    vectors[2] = -vectors[0]
+    path = tmp_path / "vectors.txt"
+    with open(path, "w") as out_file:
+        for i, vector in enumerate(vectors):
+            out_file.write("w{} {}\n".format(
+                i, " ".join("{:.6f}".format(x) for x in vector)))
+    return str(path)
+
+
+def test_word_vectors_matrix(vectors_path, tmp_path):
+    wv = words.WordVectors(vectors_path)
+    assert wv.vectors.shape == (500, 20)
+    assert wv.vectors.dtype == np.float32
+    assert wv.words[:3] == ["w0", "w1", "w2"]
+    assert wv.most_similar("w0", 1) == [("w1", pytest.approx(1, abs=1e-3))]
+    assert wv.average_vector(["w0", "w2"]) == pytest.approx(np.zeros(20), abs=1e-5)
+
+    # vectors from a second file are kept separate
+    other_path = tmp_path / "other.txt"
+    other_path.write_text("x 1 0\ny 0 1\n")
+    other = words.WordVectors(str(other_path), dtype=np.float64)
+    assert other.words == ["x", "y"]
+    assert other.vectors.dtype == np.float64
+    assert "x" not in wv.wordIndex
+
+
+def test_most_similar_ties(tmp_path):
+    path = tmp_path / "ties.txt"
+    path.write_text("a 1 0\nb 2 0\nc 1 0\nd 0 0\ne 0 1\nf 1 1\n")
+    wv = words.WordVectors(str(path))
+    # ties keep file order, the query word is excluded and n is capped
+    assert wv.most_similar("b", 10) == [
+        ("a", pytest.approx(1)),
+        ("c", pytest.approx(1)),
+        ("f", pytest.approx(0.707, abs=1e-3)),
+        ("d", 0),
+        ("e", 0),
+    ]
+    assert wv.average_vector(["a", "b"]) == pytest.approx([1.5, 0])
+
+
+def test_most_similar_batch(vectors_path):
+    wv = words.WordVectors(vectors_path)
+    queries = ["w0", "w3", "w10", "w499"]
+    batch = wv.most_similar_batch(queries, 5, block_size=3)
+    for query, neighbours in zip(queries, batch):
+        assert neighbours == [(word, pytest.approx(similarity, abs=1e-6))
+                              for word, similarity in wv.most_similar(query, 5)]
+
+    # a query vector is compared with every word, including its own
+    average_vectors = np.array([wv.average_vector(["w0", "w1"]),
+                                wv.average_vector(["w7"])])
+    batch = wv.most_similar_batch(average_vectors, 2)
+    assert [word for word, _ in batch[0]] == ["w1", "w0"]
+    assert batch[1][0] == ("w7", pytest.approx(1))
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_word_vectors_binary(vectors_path, tmp_path, mmap):
+    binary_prefix = str(tmp_path / "vectors")
+    words.convert_word_vectors(vectors_path, binary_prefix)
+    text_wv = words.WordVectors(vectors_path)
+    binary_wv = words.WordVectors.load_binary(binary_prefix, mmap=mmap)
+    assert isinstance(binary_wv.vectors, np.memmap) == mmap
+    assert binary_wv.words == text_wv.words
+    assert np.array_equal(binary_wv.vectors, text_wv.vectors)
+    assert binary_wv.most_similar("w5", 10) == text_wv.most_similar("w5", 10)
+    assert np.array_equal(binary_wv.average_vector(["w3", "w4"]),
+                          text_wv.average_vector(["w3", "w4"]))
+
+
+def test_approximate_index(vectors_path, tmp_path):
+    wv = words.WordVectors(vectors_path)
+    index = words.ApproximateIndex(wv, n_lists=10)
+    queries = ["w{}".format(i) for i in range(0, 500, 25)]
+
+    # probing every cluster is an exact search
+    for query in queries:
+        assert index.most_similar(query, 5, n_probe=10) == wv.most_similar(query, 5)
+    assert words.recall_at_n(wv, index.most_similar, queries, n=5) > 0
+
+    # recall can only grow with the number of probed clusters
+    results = words.benchmark_index(index, queries, n=5, n_probes=[1, 5, 10])
+    recalls = [result["recall"] for result in results]
+    assert recalls[0] == 1.0
+    assert recalls[1] <= recalls[2] <= recalls[3] == 1.0
+
+    index_path = str(tmp_path / "index.npz")
+    index.save(index_path)
+    loaded = words.ApproximateIndex.load(index_path, wv)
+    assert loaded.most_similar("w0", 5, n_probe=3) == \
+        index.most_similar("w0", 5, n_probe=3)
+
+
+@pytest.mark.parametrize("dtype,min_recall", [(np.float16, 0.95), (np.int8, 0.9)])
+def test_quantized_word_vectors(vectors_path, tmp_path, dtype, min_recall):
+    exact = words.WordVectors(vectors_path)
+    quantized = words.WordVectors(vectors_path, dtype=dtype)
+    assert quantized.vectors.dtype == dtype
+    assert quantized.vectors.nbytes < exact.vectors.nbytes
+
+    # rankings stay close to the exact single precision ones
+    queries = ["w{}".format(i) for i in range(0, 500, 10)]
+    assert words.recall_at_n(exact, quantized.most_similar, queries, n=10) >= min_recall
+    assert quantized.most_similar("w0", 1) == [("w1", pytest.approx(1, abs=1e-2))]
+    assert quantized.average_vector(["w5", "w6"]) == pytest.approx(
+        exact.average_vector(["w5", "w6"]), abs=0.05)
+
+    binary_prefix = str(tmp_path / "quantized")
+    quantized.save_binary(binary_prefix)
+    loaded = words.WordVectors.load_binary(binary_prefix)
+    assert loaded.most_similar("w3", 5) == quantized.most_similar("w3", 5)
+
+
+def test_half_precision_large_norms(tmp_path):
+    # norms of about 340 overflow half precision
+    rng = np.random.RandomState(0)
+    vectors = 20 * rng.normal(size=(3, 300))
+    path = tmp_path / "large.txt"
+    with open(path, "w") as out_file:
+        for i, vector in enumerate(vectors):
+            out_file.write("w{} {}\n".format(
+                i, " ".join("{:.6f}".format(x) for x in vector)))
+    exact = words.WordVectors(str(path))
+    half = words.WordVectors(str(path), dtype=np.float16)
+    assert half.vectors.dtype == np.float16
+    assert np.all(np.isfinite(half.norms))
+    assert half.norms == pytest.approx(np.linalg.norm(vectors, axis=1), rel=1e-5)
+    assert half.most_similar("w0", 2) == [
+        (word, pytest.approx(similarity, abs=1e-2))
+        for word, similarity in exact.most_similar("w0", 2)]
+    assert half.average_vector(["w0", "w1"]) == pytest.approx(
+        exact.average_vector(["w0", "w1"]), rel=1e-2, abs=0.05)
+
+
+def test_word_vectors_parsing(vectors_path):
+    wv = words.WordVectors(vectors_path)
+    parallel = words.WordVectors(vectors_path, processes=3)
+    assert parallel.words == wv.words
+    assert np.array_equal(parallel.vectors, wv.vectors)
+    assert np.array_equal(parallel.norms, wv.norms)
+
+    for processes in [1, 2]:
+        capped = words.WordVectors(vectors_path, max_words=50, processes=processes)
+        assert capped.words == wv.words[:50]
+        assert np.array_equal(capped.vectors, wv.vectors[:50])
+        filtered = words.WordVectors(vectors_path, vocab={"w9", "w3", "unknown"},
+                                     processes=processes)
+        assert filtered.words == ["w3", "w9"]
+        assert filtered.average_vector(["w3"]) == pytest.approx(
+            wv.average_vector(["w3"]))
+
+
+def test_word_vectors_cache(vectors_path):
+    uncached = words.WordVectors(vectors_path)
+    wv = words.WordVectors(vectors_path, cache_size=2)
+    assert wv.cache_info() == {"hits": 0, "misses": 0, "size": 0, "maxsize": 2}
+    assert uncached.cache_info() is None
+
+    assert wv.most_similar("w0", 10) == uncached.most_similar("w0", 10)
+    # a shorter list is served from the cached longer one
+    assert wv.most_similar("w0", 3) == uncached.most_similar("w0", 3)
+    # a longer list is not
+    assert wv.most_similar("w0", 20) == uncached.most_similar("w0", 20)
+    assert wv.cache_info() == {"hits": 1, "misses": 2, "size": 1, "maxsize": 2}
+
+    average = wv.average_vector(["w1", "w2"])
+    average[:] = 0
+    assert np.array_equal(wv.average_vector(["w1", "w2"]),
+                          uncached.average_vector(["w1", "w2"]))
+    assert wv.cache_info()["hits"] == 2
+
+    # the least recently used result is evicted
+    wv.most_similar("w5", 1)
+    assert wv.cache_info()["size"] == 2
+    wv.most_similar("w0", 20)
+    assert wv.cache_info()["misses"] == 5
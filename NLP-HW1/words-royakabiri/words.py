@@ -1,14 +1,28 @@
-from typing import List, Text, Tuple
+from typing import Callable, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Text, Tuple, Union
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from heapq import nlargest
 from collections import *
+from functools import partial
+from multiprocessing import Pool
+import glob
+import os
 import re
+import threading
+import time
+
+#the number of characters read at once when streaming a tagged file
+CHUNK_SIZE = 1 << 20
+#the number of similarities calculated at once when comparing many queries
+BLOCK_SIZE = 1 << 24
+#the number of lines parsed at once when reading word vectors from text
+PARSE_LINES = 4096
+#the number of clusters searched by default in an ApproximateIndex
+DEFAULT_PROBES = 8
 
 def most_common(word_pos_path: Text,
                 word_regex=".*",
                 pos_regex=".*",
-                n=10) -> List[Tuple[Text, int]]:
+                n=10,
+                chunk_size=CHUNK_SIZE) -> List[Tuple[Text, int]]:
     """Finds the most common words and/or parts of speech in a file.
 
     :param word_pos_path: The path of a file containing part-of-speech tagged
@@ -27,70 +41,212 @@ def most_common(word_pos_path: Text,
 
     :param n: The number of most common words and/or parts of speech to return.
 
+    :param chunk_size: The number of characters to read from the file at once.
+    The file is counted as it is streamed, so memory use stays flat as the file
+    grows.
+
     :return: A list of (token, count) tuples for the most frequent words and/or
     parts-of-speech in the file. Note that, depending on word_regex and
     pos_regex (as described above), the returned tokens will contain either
     words, part-of-speech tags, or both.
     """
-    file= open(word_pos_path,'r')
-    textFile = file.read()
-    file.close()
-    #remove tabs and new lines
-    textFile = textFile.strip()
-    #split the text into 'word/pos' tokens by space
-    wordPosList = textFile.split()
-    
-    posList=[]
-    wordList=[]
-    for wordPos in wordPosList:
-        #split 'word/pos' tokens by slash
-        splittedWordPos=wordPos.split("/")
-        #append the last element to the pos list
-        posList.append(splittedWordPos[-1])
-        #append the rest to the word list
-        wordList.append("/".join(splittedWordPos[:-1]))
-
-    if word_regex==None and pos_regex:
-        matchedPos=[]
-        #loop through the pos list
-        for word in posList:
-            if re.match(pos_regex, word):
-                matchedPos.append(word)
-        #return the n most frequent pos tags
-        mostCommonPos=Counter(matchedPos).most_common(n)
-        return mostCommonPos
-
-    elif pos_regex==None and word_regex:
-        matchedWords=[]
-        #loop through the word list
-        for word in wordList:
-            if re.match(word_regex, word):
-                matchedWords.append(word)
-        #return the n most frequent words
-        mostCommonWords=Counter(matchedWords).most_common(n)
-        return mostCommonWords
+    return count_matching(word_pos_path, word_regex, pos_regex,
+                          chunk_size).most_common(n)
+
+
+def count_matching(word_pos_path: Text,
+                   word_regex=".*",
+                   pos_regex=".*",
+                   chunk_size=CHUNK_SIZE) -> Counter:
+    """Counts the words and/or parts of speech in a file that match the given
+    regular expressions.
+
+    The file is streamed in chunks of at most chunk_size characters, so memory
+    use does not grow with the size of the file. The arguments word_pos_path,
+    word_regex and pos_regex are as in most_common.
+
+    :param chunk_size: The number of characters to read from the file at once.
+    :return: A Counter over all matching tokens, in the order in which they
+    first appear in the file.
+    """
+    keyOf = _token_key(word_regex, pos_regex)
+    if keyOf is None:
+        return Counter()
+    keys = map(keyOf, _read_tokens(word_pos_path, chunk_size))
+    #Counter counts an iterable in C, so feed it the non-skipped keys
+    return Counter(key for key in keys if key is not None)
+
+
+def most_common_files(word_pos_paths: Union[Text, Iterable[Text]],
+                      word_regex=".*",
+                      pos_regex=".*",
+                      n=10,
+                      processes: Optional[int] = None) -> List[Tuple[Text, int]]:
+    """Finds the most common words and/or parts of speech across many files.
+
+    Each file is counted in its own worker process, and the full counts are
+    merged before the n most common are selected, so the result is the same
+    as calling most_common on the concatenation of the files (in the order in
+    which they are given). The arguments word_regex, pos_regex and n are as in
+    most_common.
+
+    :param word_pos_paths: Either a glob pattern (e.g. "corpus/*.txt"), whose
+    matching files are read in sorted order, or a sequence of paths of
+    part-of-speech tagged files.
+    :param processes: The number of worker processes. If None, the number of
+    CPUs is used.
+    :return: A list of (token, count) tuples, as in most_common.
+    """
+    if isinstance(word_pos_paths, str):
+        word_pos_paths = sorted(glob.glob(word_pos_paths))
+    else:
+        word_pos_paths = list(word_pos_paths)
+    countFile = partial(count_matching, word_regex=word_regex, pos_regex=pos_regex)
+    counts = Counter()
+    with Pool(processes) as pool:
+        #imap returns the counts in path order, so ties are broken as in a single file
+        for fileCounts in pool.imap(countFile, word_pos_paths):
+            counts.update(fileCounts)
+    return counts.most_common(n)
+
+
+def _read_tokens(word_pos_path: Text, chunk_size=CHUNK_SIZE) -> Iterator[Text]:
+    """Generates the whitespace-separated tokens of a file, reading at most
+    chunk_size characters at a time.
+    """
+    with open(word_pos_path, 'r') as inFile:
+        carry = ''
+        while True:
+            chunk = inFile.read(chunk_size)
+            if not chunk:
+                break
+            chunk = carry + chunk
+            tokens = chunk.split()
+            #a token at the end of the chunk may continue in the next chunk
+            if tokens and not chunk[-1].isspace():
+                carry = tokens.pop()
+            else:
+                carry = ''
+            yield from tokens
+        if carry:
+            yield carry
+
+
+def _token_key(word_regex, pos_regex) -> Optional[Callable[[Text], Optional[Text]]]:
+    """Returns a function that maps a 'word/pos' token to the key it is counted
+    under by most_common, or to None if the token does not match. Returns None
+    if no tokens can match (both word_regex and pos_regex are None).
+    """
+    if word_regex is None and pos_regex:
+        matchPos = re.compile(pos_regex).match
+        def keyOf(wordPos):
+            #split 'word/pos' tokens on the last slash only
+            pos = wordPos.rpartition("/")[2]
+            return pos if matchPos(pos) else None
+
+    elif pos_regex is None and word_regex:
+        matchWord = re.compile(word_regex).match
+        def keyOf(wordPos):
+            word = wordPos.rpartition("/")[0]
+            return word if matchWord(word) else None
 
     elif word_regex and pos_regex:
-        matchedWordPos=[]
-        #loop through the wordPos list
-        for wordPos in wordPosList:
-            splitWordPos=wordPos.split("/")
-            #join all the elements by slash except the last one (for cases where there are more than 1 slash)
-            word="/".join(splitWordPos[:-1])
-            pos=splitWordPos[-1]
-            if re.match(word_regex, word) and re.match(pos_regex, pos):
-                matchedWordPos.append(wordPos)
-        #return the n most frequent words
-        mostCommonWordPos=Counter(matchedWordPos).most_common(n)
-        return mostCommonWordPos
+        matchWord = re.compile(word_regex).match
+        matchPos = re.compile(pos_regex).match
+        def keyOf(wordPos):
+            word, _, pos = wordPos.rpartition("/")
+            if matchWord(word) and matchPos(pos):
+                return wordPos
+            return None
 
     #when both the word-regex and non-regex are None
-    return []
+    else:
+        return None
+    return keyOf
+
+
+class WordPosIndex(object):
+    def __init__(self, word_pos_path: Text, index_path: Optional[Text] = None):
+        """Loads the count of every distinct token in a part-of-speech tagged
+        file from an index saved next to the file.
+
+        The index is rebuilt (with a single pass over the file) and saved if it
+        does not exist yet, or if the file's size or modification time no
+        longer match the ones recorded in the index.
+
+        :param word_pos_path: The path of a part-of-speech tagged file,
+        formatted as described in most_common.
+        :param index_path: The path of the index. If None, the path of the
+        tagged file followed by ".index" is used.
+        """
+        self.word_pos_path = word_pos_path
+        if index_path is None:
+            index_path = word_pos_path + ".index"
+        self.index_path = index_path
+        stat = os.stat(word_pos_path)
+        #the size and modification time identify the version of the file
+        self.signature = "{}\t{}".format(stat.st_size, stat.st_mtime_ns)
+        self.tokenCounts = self._load()
+        if self.tokenCounts is None:
+            self.tokenCounts = count_matching(word_pos_path, ".*", ".*")
+            self._save()
+
+    def _load(self) -> Optional[Counter]:
+        """Reads the token counts from the index, or returns None if the index
+        is missing or out of date.
+        """
+        try:
+            inFile = open(self.index_path, 'r')
+        except FileNotFoundError:
+            return None
+        with inFile:
+            if inFile.readline().rstrip("\n") != self.signature:
+                return None
+            tokenCounts = Counter()
+            #one 'token<tab>count' line per distinct token, in file order
+            for line in inFile:
+                token, _, count = line.rpartition("\t")
+                tokenCounts[token] = int(count)
+        return tokenCounts
+
+    def _save(self) -> None:
+        """Writes the token counts to the index."""
+        tempPath = self.index_path + ".tmp"
+        with open(tempPath, 'w') as outFile:
+            outFile.write(self.signature + "\n")
+            for token, count in self.tokenCounts.items():
+                outFile.write("{}\t{}\n".format(token, count))
+        #replace the old index only once the new one is complete
+        os.replace(tempPath, self.index_path)
+
+    def most_common(self,
+                    word_regex=".*",
+                    pos_regex=".*",
+                    n=10) -> List[Tuple[Text, int]]:
+        """Finds the most common words and/or parts of speech in the indexed
+        file. The arguments and return value are as in the module-level
+        most_common, but the regular expressions are only matched against
+        each distinct token once.
+        """
+        keyOf = _token_key(word_regex, pos_regex)
+        if keyOf is None:
+            return []
+        counts = Counter()
+        for token, count in self.tokenCounts.items():
+            key = keyOf(token)
+            if key is not None:
+                counts[key] += count
+        return counts.most_common(n)
 
 
 class WordVectors(object):
-    wordVectorDict={}
-    def __init__(self, word_vectors_path: Text):
+    def __init__(self,
+                 word_vectors_path: Text,
+                 dtype=np.float32,
+                 max_words: Optional[int] = None,
+                 vocab: Optional[Iterable[Text]] = None,
+                 processes=1,
+                 cache_size=0):
         """Reads words and their vectors from a file.
 
         :param word_vectors_path: The path of a file containing word vectors.
@@ -98,22 +254,108 @@ class WordVectors(object):
         space-separated list of floating point numbers. For example:
 
             the 0.063380 -0.146809 0.110004 -0.012050 -0.045637 -0.022240
+
+        :param dtype: The type in which the vectors are stored: a floating point
+        type (np.float32 by default; np.float16 halves the memory), or np.int8
+        to quantize each vector to bytes with its own scale factor.
+        :param max_words: If not None, only the first max_words words (of those
+        allowed by vocab) are read.
+        :param vocab: If not None, only the words in vocab are read.
+        :param processes: The number of processes that parse the file. With
+        more than one, the file is split into byte ranges that are parsed in
+        parallel.
+        :param cache_size: The number of most_similar and average_vector results
+        to keep in a least-recently-used cache. If 0, nothing is cached.
         """
         self.word_vectors_path=word_vectors_path
-        inFile = open (word_vectors_path, 'r')
-        lines = inFile.readlines()
-        inFile.close()
-        for line in lines:
-            line = line.strip()
-            splittedLine=line.split()
-            word=splittedLine[0]
-            #join the vectors by space to make them str again
-            wordVector=' '.join(splittedLine[1:])
-            #change the vectors from str to array
-            #specify sep argument as the single space was used to join the vectors
-            wordVectorArray=np.fromstring(wordVector,sep=' ')
-            #assign the word and its vector as key and value
-            self.wordVectorDict[word]=wordVectorArray
+        self.cache=QueryCache(cache_size) if cache_size else None
+        if vocab is not None:
+            vocab=frozenset(vocab)
+        if processes == 1:
+            parts=[_read_vectors(word_vectors_path, 0, None, dtype, vocab, max_words)]
+        else:
+            #several ranges per process, so that uneven ranges balance out
+            fileSize=os.path.getsize(word_vectors_path)
+            bounds=np.linspace(0, fileSize, 4 * processes + 1).astype(np.int64)
+            #the first max_words words overall are among the first max_words
+            #words of each range
+            ranges=[(word_vectors_path, int(start), int(stop), dtype, vocab, max_words)
+                    for start, stop in zip(bounds[:-1], bounds[1:])]
+            with Pool(processes) as pool:
+                parts=pool.starmap(_read_vectors, ranges)
+        #the words, in the order of the rows of the vector matrix
+        self.words=[word for partWords, _, _, _ in parts for word in partWords]
+        #the unit-length vectors; the original vectors are vectors * norms
+        self.vectors=_concatenate([vectors for _, vectors, _, _ in parts], dtype)
+        self.norms=_concatenate([norms for _, _, norms, _ in parts])
+        self.scales=None
+        if _is_quantized(dtype):
+            self.scales=_concatenate([scales for _, _, _, scales in parts], np.float32)
+        del parts
+        if max_words is not None and len(self.words) > max_words:
+            self.words=self.words[:max_words]
+            self.vectors=self.vectors[:max_words].copy()
+            self.norms=self.norms[:max_words].copy()
+            if self.scales is not None:
+                self.scales=self.scales[:max_words].copy()
+
+        #map each word to its row in the vector matrix
+        self.wordIndex={word: row for row, word in enumerate(self.words)}
+        if len(self.wordIndex) < len(self.words):
+            #a repeated word keeps its first position but its last vector
+            rows=[self.wordIndex[word] for word in dict.fromkeys(self.words)]
+            self.words=[self.words[row] for row in rows]
+            self.wordIndex={word: row for row, word in enumerate(self.words)}
+            self.vectors=self.vectors[rows]
+            self.norms=self.norms[rows]
+            if self.scales is not None:
+                self.scales=self.scales[rows]
+
+    @classmethod
+    def load_binary(cls, binary_prefix: Text, mmap=True, cache_size=0) -> "WordVectors":
+        """Reads words and their vectors from the binary files written by
+        save_binary.
+
+        :param binary_prefix: The prefix passed to save_binary.
+        :param mmap: If True, the vector matrix is memory-mapped instead of
+        read into memory, so it is loaded lazily and its pages are shared by
+        all processes that map the same files.
+        :param cache_size: The size of the query cache, as in the constructor.
+        :return: The word vectors.
+        """
+        wordVectors=cls.__new__(cls)
+        wordVectors.word_vectors_path=binary_prefix
+        wordVectors.cache=QueryCache(cache_size) if cache_size else None
+        with open(binary_prefix + ".vocab", 'r', encoding='utf-8') as inFile:
+            wordVectors.words=inFile.read().splitlines()
+        wordVectors.wordIndex={word: row for row, word in enumerate(wordVectors.words)}
+        mmapMode='r' if mmap else None
+        wordVectors.vectors=np.load(binary_prefix + ".npy", mmap_mode=mmapMode)
+        wordVectors.norms=np.load(binary_prefix + ".norms.npy", mmap_mode=mmapMode)
+        wordVectors.scales=None
+        if os.path.exists(binary_prefix + ".scales.npy"):
+            wordVectors.scales=np.load(binary_prefix + ".scales.npy", mmap_mode=mmapMode)
+        return wordVectors
+
+    def save_binary(self, binary_prefix: Text) -> None:
+        """Writes the words and their vectors in a binary layout that
+        load_binary can memory-map.
+
+        Three files are written: binary_prefix + ".npy" holds the matrix of
+        unit-length vectors, binary_prefix + ".norms.npy" holds the lengths of
+        the original vectors, and binary_prefix + ".vocab" holds the words, one
+        per line, in the order of the rows. Quantized vectors also write their
+        scale factors to binary_prefix + ".scales.npy".
+
+        :param binary_prefix: The path of the files, without their extensions.
+        """
+        np.save(binary_prefix + ".npy", self.vectors)
+        np.save(binary_prefix + ".norms.npy", self.norms)
+        if self.scales is not None:
+            np.save(binary_prefix + ".scales.npy", self.scales)
+        with open(binary_prefix + ".vocab", 'w', encoding='utf-8') as outFile:
+            for word in self.words:
+                outFile.write(word + "\n")
 
     def average_vector(self, words: List[Text]) -> np.ndarray:
         """Calculates the element-wise average of the vectors for the given
@@ -125,12 +367,23 @@ class WordVectors(object):
         :param words: The words whose vectors should be looked up and averaged.
         :return: The element-wise average of the word vectors.
         """
-        vecList=[]
-        for word in words:
-            #append the vectors of the input words to list
-            vecList.append(self.wordVectorDict[word])
+        if self.cache is not None:
+            key=("average", tuple(words))
+            vectorAverage=self.cache.get(key)
+            if vectorAverage is None:
+                vectorAverage=self._average_vector(words)
+                self.cache.put(key, vectorAverage)
+            #callers may modify the array they get, but not the cached one
+            return vectorAverage.copy()
+        return self._average_vector(words)
+
+    def _average_vector(self, words: List[Text]) -> np.ndarray:
+        """Calculates average_vector without the cache."""
+        rows=[self.wordIndex[word] for word in words]
+        #undo the normalization of the selected rows
+        wordVectors=self._unit_vectors(rows) * self.norms[rows, np.newaxis]
         #average the vectors along the specified axis
-        vectorAverage=np.average(vecList, axis=0)
+        vectorAverage=np.average(wordVectors, axis=0)
         return vectorAverage
 
     def most_similar(self, word: Text, n=10) -> List[Tuple[Text, int]]:
@@ -138,15 +391,473 @@ class WordVectors(object):
         by cosine similarity (https://en.wikipedia.org/wiki/Cosine_similarity)
         over the word vectors.
 
-        :param word: The query word.words-royakabiri
+        :param word: The query word.
         :param n: The number of most similar words to return.
         :return: The n most similar words to the query word.
         """
-        similarityDict={}
-        for key in self.wordVectorDict:
-            if key!=word:
-                #rehshape the vectors from 1D to 2D to get cosine-similarity
-                similarityDict[key]=cosine_similarity(self.wordVectorDict[word].reshape(1, -1),self.wordVectorDict[key].reshape(1, -1))[0][0]
-        #get the n most similar words to query (given their vectors)
-        mostSimilarWords=nlargest(n,similarityDict.items(), key=lambda i:i[1])
-        return mostSimilarWords
+        if self.cache is None:
+            return self.most_similar_batch([word], n)[0]
+        #a longer list of the same word also answers the query
+        key=("similar", word)
+        maxLength=len(self.words) - 1
+        mostSimilarWords=self.cache.get(
+            key, lambda cached: len(cached) >= min(n, maxLength))
+        if mostSimilarWords is None:
+            mostSimilarWords=self.most_similar_batch([word], n)[0]
+            self.cache.put(key, mostSimilarWords)
+        return mostSimilarWords[:n]
+
+    def cache_info(self) -> dict:
+        """Returns the statistics of the query cache, as returned by
+        QueryCache.info, or None if there is no cache.
+        """
+        return None if self.cache is None else self.cache.info()
+
+    def most_similar_batch(self,
+                           queries: Union[Sequence[Text], np.ndarray],
+                           n=10,
+                           block_size: Optional[int] = None) -> List[List[Tuple[Text, float]]]:
+        """Finds the most similar words to each of several queries.
+
+        The similarities are calculated as matrix-matrix products over blocks
+        of queries, so the memory needed is bounded by the block size.
+
+        :param queries: Either a sequence of query words, or a matrix with one
+        query vector per row (e.g. vectors from average_vector). A query word
+        is never among its own most similar words; a query vector may be.
+        :param n: The number of most similar words to return for each query.
+        :param block_size: The number of queries whose similarities are
+        calculated at once. If None, the block holds about BLOCK_SIZE
+        similarities.
+        :return: For each query, the n most similar words and their cosine
+        similarities, as returned by most_similar.
+        """
+        if isinstance(queries, np.ndarray):
+            queryRows=None
+            queryVectors=np.array(queries, dtype=self._float_dtype(), ndmin=2)
+            queryNorms=np.linalg.norm(queryVectors, axis=1)
+            queryVectors/=np.where(queryNorms > 0, queryNorms, 1)[:, np.newaxis]
+            n=min(n, len(self.words))
+        else:
+            queryRows=np.array([self.wordIndex[word] for word in queries], dtype=np.intp)
+            queryVectors=self._unit_vectors(queryRows)
+            n=min(n, len(self.words) - 1)
+        if block_size is None:
+            block_size=max(1, BLOCK_SIZE // max(1, len(self.words)))
+
+        results=[]
+        for start in range(0, len(queryVectors), block_size):
+            stop=start + block_size
+            #the rows are unit length, so one product gives all the cosines
+            similarities=self._similarities(queryVectors[start:stop])
+            if queryRows is not None:
+                #the query words are not their own neighbours
+                blockRows=queryRows[start:stop]
+                similarities[np.arange(len(blockRows)), blockRows]=-np.inf
+            for querySimilarities in similarities:
+                mostSimilarRows=_top_rows(querySimilarities, n)
+                results.append([(self.words[row], float(querySimilarities[row]))
+                                for row in mostSimilarRows])
+        return results
+
+    def _float_dtype(self) -> np.dtype:
+        """Returns the type in which similarities are calculated: the storage
+        type for single and double precision vectors, else single precision.
+        """
+        if self.vectors.dtype in (np.float32, np.float64):
+            return self.vectors.dtype
+        return np.dtype(np.float32)
+
+    def _unit_vectors(self, rows) -> np.ndarray:
+        """Returns the unit-length vectors of the given rows, de-quantized if
+        necessary.
+        """
+        unitVectors=self.vectors[rows].astype(self._float_dtype(), copy=False)
+        if self.scales is not None:
+            unitVectors*=self.scales[rows, np.newaxis]
+        return unitVectors
+
+    def _similarities(self, queryVectors: np.ndarray) -> np.ndarray:
+        """Calculates the cosine similarities of unit-length query vectors (one
+        per row) to every word.
+
+        Half precision and quantized vectors are converted to single precision
+        one block of about BLOCK_SIZE values at a time, so no full-precision
+        copy of the matrix is ever made.
+        """
+        if self.vectors.dtype == self._float_dtype():
+            return queryVectors @ self.vectors.T
+        similarities=np.empty((len(queryVectors), len(self.vectors)), dtype=np.float32)
+        blockSize=max(1, BLOCK_SIZE // max(1, self.vectors.shape[1]))
+        for start in range(0, len(self.vectors), blockSize):
+            stop=start + blockSize
+            block=self.vectors[start:stop].astype(np.float32)
+            similarities[:, start:stop]=queryVectors @ block.T
+        if self.scales is not None:
+            #the scale of each row applies to all of its similarities
+            similarities*=self.scales
+        return similarities
+
+
+class QueryCache(object):
+    def __init__(self, maxsize: int):
+        """Initializes a thread-safe cache that keeps the most recently used
+        results and counts its hits and misses.
+
+        :param maxsize: The maximum number of results to keep. When it is
+        exceeded, the least recently used result is evicted.
+        """
+        self.maxsize=maxsize
+        self.entries=OrderedDict()
+        self.lock=threading.Lock()
+        self.hits=0
+        self.misses=0
+
+    def get(self, key, usable: Optional[Callable[[object], bool]] = None):
+        """Looks up a result, marking it as the most recently used.
+
+        :param key: The key of the result.
+        :param usable: If not None, a cached result only counts as a hit if
+        usable(result) is True.
+        :return: The result, or None on a miss.
+        """
+        with self.lock:
+            value=self.entries.get(key)
+            if value is None or (usable is not None and not usable(value)):
+                self.misses+=1
+                return None
+            self.entries.move_to_end(key)
+            self.hits+=1
+            return value
+
+    def put(self, key, value) -> None:
+        """Stores a result, evicting the least recently used result if the
+        cache is full.
+        """
+        with self.lock:
+            self.entries[key]=value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def info(self) -> dict:
+        """Returns the "hits", "misses", "size" and "maxsize" of the cache."""
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "size": len(self.entries), "maxsize": self.maxsize}
+
+
+class ApproximateIndex(object):
+    def __init__(self,
+                 word_vectors: WordVectors,
+                 n_lists: Optional[int] = None,
+                 n_iter=10,
+                 sample_size: Optional[int] = None,
+                 seed=0):
+        """Builds an inverted file index for approximate most similar word
+        queries over a set of word vectors.
+
+        The unit-length word vectors are clustered by spherical k-means, and
+        each word is listed under its nearest cluster centroid. A query only
+        compares the query vector with the words listed under the centroids
+        nearest to it.
+
+        :param word_vectors: The word vectors to index.
+        :param n_lists: The number of clusters. If None, the square root of the
+        vocabulary size is used.
+        :param n_iter: The number of k-means iterations.
+        :param sample_size: The number of randomly sampled words that the
+        clusters are trained on. If None, 256 words per cluster are used.
+        :param seed: The seed of the random number generator used for sampling.
+        """
+        self.word_vectors=word_vectors
+        vectors=word_vectors.vectors
+        if n_lists is None:
+            n_lists=max(1, int(np.sqrt(len(vectors))))
+        n_lists=min(n_lists, len(vectors))
+        if sample_size is None:
+            sample_size=256 * n_lists
+        random=np.random.RandomState(seed)
+        sample=word_vectors._unit_vectors(np.sort(random.permutation(len(vectors))[:sample_size]))
+
+        #start from randomly chosen words
+        centroids=sample[random.permutation(len(sample))[:n_lists]].astype(np.float32)
+        for _ in range(n_iter):
+            assignments=_nearest_centroids(sample, centroids)
+            sums=np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            norms=np.linalg.norm(sums, axis=1)
+            #an empty cluster starts again from a random word
+            empty=norms == 0
+            sums[empty]=sample[random.randint(len(sample), size=empty.sum())]
+            norms[empty]=1
+            centroids=sums / norms[:, np.newaxis]
+        self.centroids=centroids
+
+        #list the rows of each cluster contiguously, in row order
+        assignments=_nearest_centroids(vectors, centroids)
+        self.listRows=np.argsort(assignments, kind='stable')
+        self.listOffsets=np.concatenate(
+            [[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+
+    @classmethod
+    def load(cls, index_path: Text, word_vectors: WordVectors) -> "ApproximateIndex":
+        """Reads an index written by save.
+
+        :param index_path: The path of the index.
+        :param word_vectors: The word vectors the index was built from.
+        :return: The index.
+        """
+        index=cls.__new__(cls)
+        index.word_vectors=word_vectors
+        with np.load(index_path) as arrays:
+            index.centroids=arrays["centroids"]
+            index.listRows=arrays["listRows"]
+            index.listOffsets=arrays["listOffsets"]
+        return index
+
+    def save(self, index_path: Text) -> None:
+        """Writes the index (but not the word vectors) to a .npz file.
+
+        :param index_path: The path of the index.
+        """
+        with open(index_path, 'wb') as outFile:
+            np.savez(outFile, centroids=self.centroids, listRows=self.listRows,
+                     listOffsets=self.listOffsets)
+
+    def most_similar(self, word: Text, n=10, n_probe=DEFAULT_PROBES) -> List[Tuple[Text, float]]:
+        """Finds the words that are probably most similar to a query word.
+
+        :param word: The query word.
+        :param n: The number of most similar words to return.
+        :param n_probe: The number of clusters nearest to the query whose words
+        are compared with the query. More clusters give a higher recall but a
+        slower search; all clusters give the same result as
+        WordVectors.most_similar.
+        :return: The n most similar words that were found, as returned by
+        WordVectors.most_similar.
+        """
+        wordVectors=self.word_vectors
+        queryRow=wordVectors.wordIndex[word]
+        queryVector=wordVectors._unit_vectors([queryRow])[0]
+        n_probe=min(n_probe, len(self.centroids))
+        probedLists=_top_rows(self.centroids @ queryVector, n_probe)
+        candidates=np.sort(np.concatenate(
+            [self.listRows[self.listOffsets[i]:self.listOffsets[i + 1]] for i in probedLists]))
+        #the query word is not its own neighbour
+        candidates=candidates[candidates != queryRow]
+        similarities=wordVectors._unit_vectors(candidates) @ queryVector
+        mostSimilar=_top_rows(similarities, n)
+        return [(wordVectors.words[candidates[i]], float(similarities[i])) for i in mostSimilar]
+
+
+def recall_at_n(word_vectors: WordVectors,
+                most_similar: Callable[[Text, int], List[Tuple[Text, float]]],
+                words: Iterable[Text],
+                n=10) -> float:
+    """Measures how many of the exact most similar words a search finds.
+
+    :param word_vectors: The word vectors whose most_similar gives the exact
+    most similar words.
+    :param most_similar: The search to evaluate, called as most_similar(word, n),
+    e.g. the most_similar method of an ApproximateIndex, or of WordVectors
+    stored in half precision or quantized to integers.
+    :param words: The query words.
+    :param n: The number of most similar words to compare.
+    :return: The fraction of the exact n most similar words, over all query
+    words, that are among the n words returned by the search.
+    """
+    found=0
+    total=0
+    for word in words:
+        exactWords={similarWord for similarWord, _ in word_vectors.most_similar(word, n)}
+        foundWords={similarWord for similarWord, _ in most_similar(word, n)}
+        found+=len(exactWords & foundWords)
+        total+=len(exactWords)
+    return found / total if total else 1.0
+
+
+def benchmark_index(index: ApproximateIndex,
+                    words: Sequence[Text],
+                    n=10,
+                    n_probes: Iterable[int] = (1, 2, 4, 8, 16, 32)) -> List[dict]:
+    """Measures the recall@n and speed of an index for a range of n_probe
+    values, against the exact WordVectors.most_similar.
+
+    :param index: The index to evaluate.
+    :param words: The query words.
+    :param n: The number of most similar words to compare.
+    :param n_probes: The n_probe values to evaluate.
+    :return: A dict for the exact search and for each n_probe, holding the
+    "n_probe" (None for the exact search), the "recall" and the
+    "queries_per_second".
+    """
+    word_vectors=index.word_vectors
+    searches=[(None, word_vectors.most_similar)]
+    for n_probe in n_probes:
+        searches.append((n_probe, partial(index.most_similar, n_probe=n_probe)))
+    results=[]
+    for n_probe, most_similar in searches:
+        start=time.perf_counter()
+        for word in words:
+            most_similar(word, n)
+        seconds=time.perf_counter() - start
+        results.append({
+            "n_probe": n_probe,
+            "recall": recall_at_n(word_vectors, most_similar, words, n),
+            "queries_per_second": len(words) / seconds if seconds else float("inf"),
+        })
+    return results
+
+
+def convert_word_vectors(word_vectors_path: Text,
+                         binary_prefix: Text,
+                         dtype=np.float32) -> None:
+    """Converts a text file of word vectors to the binary layout read by
+    WordVectors.load_binary.
+
+    :param word_vectors_path: The path of a text file of word vectors, as read
+    by WordVectors.
+    :param binary_prefix: The path of the binary files, without their
+    extensions.
+    :param dtype: The floating point type in which the vectors are stored.
+    """
+    WordVectors(word_vectors_path, dtype=dtype).save_binary(binary_prefix)
+
+
+def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Returns the index of the most similar centroid for each unit vector,
+    comparing blocks of about BLOCK_SIZE similarities at a time.
+
+    Quantized vectors may be passed without their scale factors, since a
+    positive scale does not change which centroid is the most similar.
+    """
+    blockSize=max(1, BLOCK_SIZE // len(centroids))
+    nearest=np.empty(len(vectors), dtype=np.intp)
+    for start in range(0, len(vectors), blockSize):
+        stop=start + blockSize
+        block=vectors[start:stop].astype(centroids.dtype, copy=False)
+        nearest[start:stop]=np.argmax(block @ centroids.T, axis=1)
+    return nearest
+
+
+def _read_vectors(word_vectors_path: Text,
+                  start: int,
+                  stop: Optional[int],
+                  dtype,
+                  vocab: Optional[FrozenSet[Text]],
+                  max_words: Optional[int]) -> Tuple[List[Text], np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """Reads the words and vectors on the lines of a word vectors file that
+    start within a range of bytes.
+
+    Lines are parsed PARSE_LINES at a time with numpy, and each block is
+    normalized and converted to the storage type straight away.
+
+    :param word_vectors_path: The path of the word vectors file.
+    :param start: The offset of the first byte of the range.
+    :param stop: The offset just past the last byte of the range, or None for
+    the end of the file.
+    :param dtype: The storage type, as in WordVectors.
+    :param vocab: If not None, the only words to read.
+    :param max_words: If not None, the number of words after which to stop.
+    :return: The words, their unit-length vectors, their norms and their
+    scale factors, as returned by _unit_rows.
+    """
+    #parse and normalize in at least single precision, since the norms of
+    #large vectors overflow half precision
+    parseDtype=np.float64 if np.dtype(dtype) == np.float64 else np.float32
+    words=[]
+    blocks=[]
+    blockWords=[]
+    blockValues=[]
+    with open(word_vectors_path, 'rb') as inFile:
+        if start > 0:
+            #skip the rest of a line that started before the range
+            inFile.seek(start - 1)
+            inFile.readline()
+        position=inFile.tell()
+        while stop is None or position < stop:
+            line=inFile.readline()
+            if not line:
+                break
+            position+=len(line)
+            splittedLine=line.decode('utf-8').split(None, 1)
+            if not splittedLine or (vocab is not None and splittedLine[0] not in vocab):
+                continue
+            blockWords.append(splittedLine[0])
+            blockValues.append(splittedLine[1])
+            full=max_words is not None and len(words) + len(blockWords) >= max_words
+            if len(blockWords) == PARSE_LINES or full:
+                blocks.append(_unit_rows(_parse_floats(blockValues, parseDtype), dtype))
+                words.extend(blockWords)
+                blockWords=[]
+                blockValues=[]
+            if full:
+                break
+    if blockWords:
+        blocks.append(_unit_rows(_parse_floats(blockValues, parseDtype), dtype))
+        words.extend(blockWords)
+    scales=None
+    if _is_quantized(dtype):
+        scales=_concatenate([blockScales for _, _, blockScales in blocks], np.float32)
+    return (words,
+            _concatenate([blockVectors for blockVectors, _, _ in blocks], dtype),
+            _concatenate([blockNorms for _, blockNorms, _ in blocks], parseDtype),
+            scales)
+
+
+def _parse_floats(lines: List[Text], dtype) -> np.ndarray:
+    """Parses lines of space-separated floating point numbers into a matrix."""
+    return np.loadtxt(lines, dtype=dtype, comments=None, ndmin=2)
+
+
+def _concatenate(arrays: List[np.ndarray], dtype=None) -> np.ndarray:
+    """Joins arrays along their first axis, allowing an empty list."""
+    arrays=[array for array in arrays if len(array)]
+    if not arrays:
+        return np.empty(0, dtype=dtype)
+    return np.concatenate(arrays)
+
+
+def _is_quantized(dtype) -> bool:
+    """Returns True if vectors of the given type are stored as integers."""
+    return np.issubdtype(np.dtype(dtype), np.integer)
+
+
+def _unit_rows(vectors: np.ndarray, dtype) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """Normalizes the rows of a floating point matrix in place and converts
+    them to the storage type.
+
+    :param vectors: The matrix, with one vector per row.
+    :param dtype: The storage type. For an integer type, each row is scaled so
+    that its largest absolute value becomes the largest integer of the type.
+    :return: The unit-length rows in the storage type, the lengths of the
+    original rows, and the factors that de-quantize each row (None unless the
+    storage type is an integer type).
+    """
+    norms=np.linalg.norm(vectors, axis=1)
+    #leave all-zero vectors as they are (their similarities are all 0)
+    vectors/=np.where(norms > 0, norms, 1)[:, np.newaxis]
+    if not _is_quantized(dtype):
+        return vectors.astype(dtype, copy=False), norms, None
+    scales=np.abs(vectors).max(axis=1, initial=0) / np.iinfo(dtype).max
+    vectors/=np.where(scales > 0, scales, 1)[:, np.newaxis]
+    return np.rint(vectors).astype(dtype), norms, scales.astype(np.float32)
+
+
+def _top_rows(similarities: np.ndarray, n: int) -> np.ndarray:
+    """Returns the indexes of the n largest similarities, largest first.
+
+    Ties are broken in favour of the lower index, as heapq.nlargest does.
+    """
+    if n <= 0:
+        return np.empty(0, dtype=np.intp)
+    if n < len(similarities):
+        #the n largest in arbitrary order, without sorting the rest
+        threshold=similarities[np.argpartition(similarities, -n)[-n:]].min()
+        #include every row tied with the n-th largest, so ties are broken by row
+        candidates=np.flatnonzero(similarities >= threshold)
+    else:
+        candidates=np.arange(len(similarities))
+    order=np.lexsort((candidates, -similarities[candidates]))
+    return candidates[order[:n]]
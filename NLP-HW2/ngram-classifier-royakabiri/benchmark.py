@@ -0,0 +1,242 @@
+"""Benchmarks the throughput and memory use of the spam classifier.
+
+Corpora of each size are synthesized by resampling the messages of the bundled
+SMSSpam file, and each size is measured in a fresh process, so that its peak
+memory is its own. The results are written as JSON, and may be compared with
+those of an earlier run, in which case the exit status is 1 if any measurement
+regressed by more than the tolerance. For example:
+
+    python benchmark.py --sizes 10000 100000 --output baseline.json
+    python benchmark.py --sizes 10000 100000 --output new.json --baseline baseline.json
+"""
+from typing import Dict, List, Optional, Sequence, Text, Tuple
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+from scipy.sparse import vstack
+
+import classify
+
+#the file whose messages are resampled
+SMSSPAM_PATH = "smsspam/SMSSpamCollection"
+#the number of messages converted and predicted at once
+TRANSFORM_BATCH_SIZE = 10000
+
+#the measurements where higher is better; for all others lower is better
+HIGHER_IS_BETTER = {"transform_messages_per_second", "labels_messages_per_second",
+                    "predict_messages_per_second"}
+
+
+def resample(n_messages: int, smsspam_path=SMSSPAM_PATH, seed=0) -> List[Tuple[Text, Text]]:
+    """Draws (label, text) tuples at random, with replacement, from the
+    messages of an SMSSpam file.
+
+    :param n_messages: The number of messages to draw.
+    :param smsspam_path: The SMSSpam file.
+    :param seed: The seed of the random number generator.
+    :return: The drawn messages.
+    """
+    examples = list(classify.read_smsspam(smsspam_path))
+    indices = np.random.default_rng(seed).integers(len(examples), size=n_messages)
+    return [examples[i] for i in indices]
+
+
+def _reset_peak_rss() -> bool:
+    """Resets the peak resident memory of this process to its current resident
+    memory, so that _peak_rss_mb measures the next stage on its own. Only Linux
+    supports this.
+
+    :return: True if the peak was reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clearRefs:
+            clearRefs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> float:
+    """Returns the peak resident memory of this process, in MiB, since the last
+    _reset_peak_rss, or since the process started where that is not supported.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    #in kilobytes
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def measure(n_messages: int, smsspam_path=SMSSPAM_PATH, seed=0) -> Dict:
+    """Measures each stage of training and applying the classifier on a
+    resampled corpus. The peak memory is that of the calling process, so call
+    this in a fresh process for each size. On Linux, the peak memory of each
+    stage is its own. Elsewhere, it is the peak of all stages up to it.
+
+    :param n_messages: The number of messages in the corpus.
+    :param smsspam_path: The SMSSpam file whose messages are resampled.
+    :param seed: The seed of the random number generator.
+    :return: A dict with the "fit_seconds" of TextToFeatures, the
+    "vocabulary_size", the "transform_messages_per_second" of TextToFeatures,
+    the "labels_messages_per_second" of TextToLabels, the "train_seconds" and
+    "predict_messages_per_second" of Classifier, and the "peak_rss_mb" of each
+    stage.
+    """
+    peaks = {}
+    _reset_peak_rss()
+    examples = resample(n_messages, smsspam_path, seed)
+    labels, texts = zip(*examples)
+    del examples
+    peaks["resample"] = _peak_rss_mb()
+    _reset_peak_rss()
+
+    start = time.perf_counter()
+    to_features = classify.TextToFeatures(texts)
+    fitSeconds = time.perf_counter() - start
+    peaks["fit"] = _peak_rss_mb()
+    _reset_peak_rss()
+
+    start = time.perf_counter()
+    features = vstack([to_features(texts[i:i + TRANSFORM_BATCH_SIZE])
+                       for i in range(0, n_messages, TRANSFORM_BATCH_SIZE)], format='csr')
+    transformSeconds = time.perf_counter() - start
+    peaks["transform"] = _peak_rss_mb()
+    _reset_peak_rss()
+
+    start = time.perf_counter()
+    to_labels = classify.TextToLabels(labels)
+    labelIndices = to_labels(labels)
+    labelsSeconds = time.perf_counter() - start
+    peaks["labels"] = _peak_rss_mb()
+    _reset_peak_rss()
+
+    start = time.perf_counter()
+    classifier = classify.Classifier()
+    classifier.train(features, labelIndices)
+    trainSeconds = time.perf_counter() - start
+    peaks["train"] = _peak_rss_mb()
+    _reset_peak_rss()
+
+    start = time.perf_counter()
+    for i in range(0, n_messages, TRANSFORM_BATCH_SIZE):
+        classifier.predict(to_features(texts[i:i + TRANSFORM_BATCH_SIZE]))
+    predictSeconds = time.perf_counter() - start
+    peaks["predict"] = _peak_rss_mb()
+
+    return {
+        "fit_seconds": fitSeconds,
+        "vocabulary_size": len(to_features.vectorizer.vocabulary_),
+        "transform_messages_per_second": n_messages / transformSeconds,
+        "labels_messages_per_second": n_messages / labelsSeconds,
+        "train_seconds": trainSeconds,
+        "predict_messages_per_second": n_messages / predictSeconds,
+        "peak_rss_mb": peaks,
+    }
+
+
+def run(sizes: Sequence[int], smsspam_path=SMSSPAM_PATH, seed=0) -> Dict:
+    """Measures each corpus size in its own process.
+
+    :param sizes: The numbers of messages in the corpora.
+    :param smsspam_path: The SMSSpam file whose messages are resampled.
+    :param seed: The seed of the random number generator.
+    :return: A dict with the "python" and "platform" versions, and the
+    "results" of measure for each size (as a string), or an "error" for sizes
+    whose process failed, e.g., by running out of memory.
+    """
+    results = {}
+    for size in sizes:
+        process = subprocess.run(
+            [sys.executable, __file__, "--measure", str(size),
+             "--smsspam-path", smsspam_path, "--seed", str(seed)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if process.returncode == 0:
+            results[str(size)] = json.loads(process.stdout)
+        else:
+            error = process.stderr.strip().split("\n")[-1] if process.stderr.strip() else ""
+            results[str(size)] = {"error": "exit status {}: {}".format(process.returncode, error)}
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(baseline: Dict, current: Dict, tolerance=0.2) -> List[Text]:
+    """Finds the measurements that got worse than in a baseline run.
+
+    :param baseline: The result of an earlier run.
+    :param current: The result of this run.
+    :param tolerance: The relative change that is not yet a regression.
+    :return: A description of each regression.
+    """
+    regressions = []
+    for size, before in baseline["results"].items():
+        after = current["results"].get(size)
+        if after is None or "error" in before:
+            continue
+        if "error" in after:
+            regressions.append("{}: {}".format(size, after["error"]))
+            continue
+        pairs = [(name, before[name], after[name]) for name in before
+                 if name not in ("vocabulary_size", "peak_rss_mb")]
+        pairs.extend(("peak_rss_mb." + stage, before["peak_rss_mb"][stage], after["peak_rss_mb"][stage])
+                     for stage in before["peak_rss_mb"])
+        for name, old, new in pairs:
+            if name in HIGHER_IS_BETTER:
+                worse = new < old * (1 - tolerance)
+            else:
+                worse = new > old * (1 + tolerance)
+            if worse:
+                regressions.append("{}: {} went from {:.4g} to {:.4g}".format(size, name, old, new))
+    return regressions
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="the numbers of messages in the corpora")
+    parser.add_argument("--smsspam-path", default=SMSSPAM_PATH,
+                        help="the SMSSpam file whose messages are resampled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="a file to write the results to")
+    parser.add_argument("--baseline", help="the results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="the relative change that is not yet a regression")
+    parser.add_argument("--measure", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.measure is not None:
+        #measure a single size, in the process started by run
+        print(json.dumps(measure(args.measure, args.smsspam_path, args.seed)))
+        return 0
+    current = run(args.sizes, args.smsspam_path, args.seed)
+    text = json.dumps(current, indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as outputFile:
+            outputFile.write(text + "\n")
+    else:
+        print(text)
+    if args.baseline is not None:
+        with open(args.baseline) as baselineFile:
+            regressions = compare(json.load(baselineFile), current, args.tolerance)
+        for regression in regressions:
+            print("regression:", regression, file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
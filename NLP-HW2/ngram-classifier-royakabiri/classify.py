@@ -1,14 +1,40 @@
-from typing import Iterator, Iterable, Tuple, Text, Union
+from typing import Callable, Iterator, Iterable, List, Optional, Sequence, Tuple, Text, Union
+from collections import Counter, OrderedDict, deque
+import copy
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import re
+import struct
+import threading
+import time
 import numpy as np
-from scipy.sparse import spmatrix
-from sklearn.feature_extraction.text import CountVectorizer
+from multiprocessing import Pool
+from scipy.sparse import spmatrix, vstack
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+from sklearn.utils import murmurhash3_32
 from sklearn import preprocessing
-from sklearn.linear_model import LogisticRegression
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 
 NDArray = Union[np.ndarray, spmatrix]
 
+#the start of every model file written by save_model, and its format version
+MODEL_MAGIC = b"SMSMODEL"
+MODEL_VERSION = 1
+#the byte alignment of the arrays in model files
+MODEL_ALIGNMENT = 64
 
-def read_smsspam(smsspam_path: str) -> Iterator[Tuple[Text, Text]]:
+#the number of texts featurized at once by a worker process
+TRANSFORM_CHUNK_SIZE = 2000
+
+#runs of white space, which the vectorizers collapse to a single space
+_WHITE_SPACES = re.compile(r"\s\s+")
+
+
+def read_smsspam(smsspam_path: str,
+                 batch_size: Optional[int] = None) -> Iterator[Union[Tuple[Text, Text], List[Tuple[Text, Text]]]]:
     """Generates (label, text) tuples from the lines in an SMSSpam file.
 
     SMSSpam files contain one message per line. Each line is composed of a label
@@ -19,27 +45,55 @@ def read_smsspam(smsspam_path: str) -> Iterator[Tuple[Text, Text]]:
       ham	I can take you at like noon
       ham	Where is it. Is there any opening for mca.
 
+    The file is read lazily, one line at a time. Files whose names end in
+    ".gz" are decompressed as they are read.
+
     :param smsspam_path: The path of an SMSSpam file, formatted as above.
-    :return: An iterator over (label, text) tuples.
+    :param batch_size: If None, each (label, text) tuple is generated on its
+    own. Otherwise, lists of up to batch_size tuples are generated.
+    :return: An iterator over (label, text) tuples, or over lists of them.
     """
-    #open the text file
-    textFile=open(smsspam_path, 'r')
-    #read the text file line by line
-    lines=textFile.readlines()
-    textFile.close()
-    smsspamList=[]
-    for line in lines:
-        #remove new lines
-        line=line.strip("\n")
-        #split by tab to separate the label and the text
-        splittedline=line.split("\t")
-        #append the label and the text as a tuple to a list
-        smsspamList.append(splittedline)
-    #return the new list
-    return  smsspamList
+    examples = _read_smsspam_lines(smsspam_path)
+    if batch_size is None:
+        return examples
+    return _batches(examples, batch_size)
+
+
+def _read_smsspam_lines(smsspam_path: str) -> Iterator[Tuple[Text, Text]]:
+    """Generates the (label, text) tuples of read_smsspam."""
+    #open the text file, decompressing it if necessary
+    if smsspam_path.endswith(".gz"):
+        textFile = gzip.open(smsspam_path, 'rt')
+    else:
+        textFile = open(smsspam_path, 'r')
+    with textFile:
+        #read the text file line by line
+        for line in textFile:
+            #remove new lines
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            #split on the first tab to separate the label and the text
+            label, _, text = line.partition("\t")
+            yield label, text
+
+
+def _batches(items: Iterable, batch_size: int) -> Iterator[List]:
+    """Generates lists of up to batch_size consecutive items."""
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
 
 class TextToFeatures:
-    def __init__(self, texts: Iterable[Text]):
+    def __init__(self,
+                 texts: Optional[Iterable[Text]],
+                 n_features: Optional[int] = None,
+                 analyzer='char',
+                 ngram_range=(1, 6),
+                 binary=True):
         """Initializes an object for converting texts to features.
 
         During initialization, the provided training texts are analyzed to
@@ -51,18 +105,42 @@ class TextToFeatures:
         text, but the features will always include some single words and some
         multi-word expressions (e.g., "need" and "to you").
 
-        :param texts: The training texts.
+        If n_features is given, features are instead hashed into a fixed number
+        of columns. No vocabulary is kept in memory, the training texts are not
+        needed, and any batch of texts can be converted on its own.
+
+        :param texts: The training texts. Ignored (and may be None) when
+        n_features is given.
+        :param n_features: If None, the vocabulary is learned from the texts.
+        Otherwise, the number of hash buckets (columns) for the features.
+        :param analyzer: Whether the n-grams are of 'char'acters or 'word's.
+        :param ngram_range: The (smallest, largest) n of the n-grams.
+        :param binary: If True, each feature is whether an n-gram occurs in the
+        text. Otherwise, it is the number of times it occurs.
         """
+        self.n_features = n_features
+        if n_features is not None:
+            #same features as below, hashed instead of looked up in a vocabulary
+            self.vectorizer = HashingVectorizer(binary=binary, ngram_range=ngram_range, analyzer=analyzer,
+                                                n_features=n_features, alternate_sign=False,
+                                                norm=None, dtype=np.int64)
+            return
         #extract numerical features from text content
         #also tune the parameters to get higher accuracy and F1
         #binarizing the features to get higher accuracy and F1
         #character-based analyzer gives higher F1 than word-based
         #in char-based, ngram should have large range
-        self.vectorizer = CountVectorizer(binary=True, ngram_range=(1, 6),analyzer='char') 
+        self.vectorizer = CountVectorizer(binary=binary, ngram_range=ngram_range,analyzer=analyzer) 
         #learn the vocabulary dictionary of all tokens
         self.vectorizer.fit(texts)
 
     def index(self, feature: Text):
+        if self.n_features is not None:
+            #the bucket the hashing vectorizer puts the term in
+            hashValue = murmurhash3_32(feature, seed=0)
+            if hashValue == -2 ** 31:
+                return (2 ** 31 - 1 - (self.n_features - 1)) % self.n_features
+            return abs(hashValue) % self.n_features
         #mapping of terms to feature indices by vocabulary_ attribute of the vectorizer
         feature_index = self.vectorizer.vocabulary_.get(feature) 
         return feature_index  
@@ -72,6 +150,63 @@ class TextToFeatures:
         featureMatrix=self.vectorizer.transform(texts)
         return featureMatrix 
 
+    def transform_parallel(self, texts: Iterable[Text], processes: Optional[int] = None,
+                           chunk_size=TRANSFORM_CHUNK_SIZE) -> NDArray:
+        """Converts texts to a feature matrix like __call__, but featurizes
+        chunks of the texts in a pool of worker processes.
+
+        :param texts: The texts.
+        :param processes: The number of worker processes. If None, the number
+        of CPUs is used.
+        :param chunk_size: The number of texts sent to a worker at once.
+        :return: The same feature matrix as __call__.
+        """
+        chunks = list(self.iter_transform(texts, processes, chunk_size))
+        if not chunks:
+            return self([])
+        return vstack(chunks, format='csr')
+
+    def iter_transform(self, texts: Iterable[Text], processes: Optional[int] = None,
+                       chunk_size=TRANSFORM_CHUNK_SIZE) -> Iterator[NDArray]:
+        """Generates the feature matrices of consecutive chunks of texts, which
+        are featurized in a pool of worker processes. The texts are read, and
+        the matrices generated, as they are needed, with at most two chunks per
+        process outstanding, so neither has to fit in memory at once.
+
+        :param texts: The texts.
+        :param processes: The number of worker processes. If None, the number
+        of CPUs is used.
+        :param chunk_size: The number of texts in a chunk.
+        :return: An iterator over the feature matrices of the chunks, in order.
+        """
+        with Pool(processes, initializer=_set_worker_model, initargs=(self, None)) as pool:
+            yield from _bounded_imap(pool, _transform_chunk, _batches(texts, chunk_size), processes)
+
+    def select_features(self, columns: np.ndarray) -> 'TextToFeatures':
+        """Creates a converter that only produces some of the features.
+
+        :param columns: The increasing column indices of the features to keep.
+        :return: A converter whose column j is column columns[j] of this one.
+        """
+        if self.n_features is not None:
+            raise ValueError("hashed features have no vocabulary to select from")
+        #the features in the order of their columns
+        terms = self.vectorizer.get_feature_names_out()[columns]
+        selected = copy.copy(self)
+        selected.vectorizer = _fixed_vectorizer(self.vectorizer.get_params(), terms)
+        return selected
+
+def _fixed_vectorizer(params: dict, terms: Sequence[Text]) -> CountVectorizer:
+    """Creates a CountVectorizer with the given parameters whose vocabulary is
+    the given terms, in column order.
+    """
+    vectorizer = CountVectorizer(**params)
+    #set the fitted attributes directly, which skips re-validating the terms
+    vectorizer.vocabulary_ = dict(zip(terms, range(len(terms))))
+    vectorizer.fixed_vocabulary_ = True
+    return vectorizer
+
+
 class TextToLabels:
     def __init__(self, labels: Iterable[Text]):
         """Initializes an object for converting texts to labels.
@@ -113,13 +248,27 @@ class TextToLabels:
         return labelVector
 
 class Classifier:
-    def __init__(self):
+    def __init__(self, incremental=False, penalty='l1', C=5, alpha=1e-4):
         """Initalizes a logistic regression classifier.
+
+        :param incremental: If True, the classifier is trained one minibatch
+        at a time with train_batch, by stochastic gradient descent on the
+        logistic loss, so memory is bounded by the size of a minibatch.
+        :param penalty: The regularization, 'l1' or 'l2'.
+        :param C: The inverse of the regularization strength. Ignored when
+        incremental.
+        :param alpha: The regularization strength when incremental. Ignored
+        otherwise.
         """
+        self.incremental = incremental
+        if incremental:
+            self.logisticRegr = SGDClassifier(loss='log_loss', penalty=penalty, alpha=alpha,
+                                              random_state=0)
+            return
         #tune the parameters to get higher accuracy and F1
         #l1 regularization works better than l2 here
         #parameter C for regularization strength (smaller values specify stronger regularization)
-        self.logisticRegr = LogisticRegression(penalty='l1',solver='liblinear', C=5)
+        self.logisticRegr = LogisticRegression(penalty=penalty,solver='liblinear', C=C)
 
     def train(self, features: NDArray, labels: NDArray) -> None:
         """Trains the classifier using the given training examples.
@@ -132,6 +281,20 @@ class Classifier:
         #fit the model according to the given training data (both features and lables)
         self.logisticRegr.fit(features, labels)
 
+    def train_batch(self, features: NDArray, labels: NDArray,
+                    classes: Optional[NDArray] = None) -> None:
+        """Updates an incremental classifier with one minibatch of training
+        examples, starting from the weights learned so far.
+
+        :param features: A feature matrix, where each row represents a text.
+        :param labels: A label vector, where each entry represents a label.
+        :param classes: All label indices that may ever occur. Required for the
+        first minibatch only.
+        """
+        if not self.incremental:
+            raise ValueError("train_batch requires Classifier(incremental=True)")
+        self.logisticRegr.partial_fit(features, labels, classes=classes)
+
     def predict(self, features: NDArray) -> NDArray:
         """Makes predictions for each of the given examples.
 
@@ -143,5 +306,525 @@ class Classifier:
         predictionVector = self.logisticRegr.predict(features)
         return predictionVector
 
+    def predict_proba(self, features: NDArray) -> np.ndarray:
+        """Estimates the probability of each label for each of the given
+        examples.
+
+        :param features: A feature matrix, where each row represents a text.
+        :return: A matrix with a row per example and a column per label index,
+        in increasing order.
+        """
+        return self.logisticRegr.predict_proba(features)
+
+    def nonzero_features(self) -> np.ndarray:
+        """Returns the column indices of the features with a nonzero weight.
+
+        With l1 regularization, most weights are exactly zero after training,
+        and the corresponding features cannot affect any prediction.
+        """
+        return np.flatnonzero(np.any(self.logisticRegr.coef_ != 0, axis=0))
+
+    def select_features(self, columns: np.ndarray) -> 'Classifier':
+        """Creates a classifier that only uses some of the features.
+
+        :param columns: The increasing column indices of the features to keep,
+        as passed to TextToFeatures.select_features.
+        :return: A classifier that takes the features selected by columns.
+        """
+        selected = copy.copy(self)
+        selected.logisticRegr = copy.copy(self.logisticRegr)
+        selected.logisticRegr.coef_ = self.logisticRegr.coef_[:, columns]
+        selected.logisticRegr.n_features_in_ = len(columns)
+        return selected
+
+
+def train_stream(classifier: Classifier,
+                 to_features: TextToFeatures,
+                 to_labels: TextToLabels,
+                 batches: Iterable[Iterable[Tuple[Text, Text]]]) -> None:
+    """Trains an incremental classifier on a stream of minibatches.
+
+    Training continues from the classifier's current weights, so a classifier
+    trained (and pickled) earlier can be warm-started with new data. For memory
+    bounded by the minibatch size, use a hashing TextToFeatures.
+
+    :param classifier: A Classifier(incremental=True).
+    :param to_features: The converter from texts to features.
+    :param to_labels: The converter from labels to label indices.
+    :param batches: Lists of (label, text) tuples, e.g. from
+    read_smsspam(path, batch_size=...).
+    """
+    classes = np.arange(len(to_labels.encoder.classes_))
+    for batch in batches:
+        labels, texts = zip(*batch)
+        classifier.train_batch(to_features(texts), to_labels(labels), classes)
+
+
+def prune(to_features: TextToFeatures, classifier: Classifier) -> Tuple[TextToFeatures, Classifier]:
+    """Removes the features with zero weight from a trained model.
+
+    The pruned converter only extracts the features the classifier uses, so it
+    produces narrower feature matrices, and the pruned classifier makes the
+    same predictions on them as the original classifier on the full matrices.
+
+    :param to_features: The converter the classifier was trained with.
+    :param classifier: The trained classifier.
+    :return: The pruned converter and the pruned classifier.
+    """
+    columns = classifier.nonzero_features()
+    return to_features.select_features(columns), classifier.select_features(columns)
+
+
+def _count_overlapping(text: Text, ngram: Text) -> int:
+    """Counts the occurrences of an n-gram in a text, including overlapping
+    ones (unlike str.count).
+    """
+    count = 0
+    start = text.find(ngram)
+    while start >= 0:
+        count += 1
+        start = text.find(ngram, start + 1)
+    return count
+
+
+class MessageScorer:
+    def __init__(self, to_features: TextToFeatures, classifier: Classifier):
+        """Initializes a fast scorer for one message at a time from a trained
+        converter and binary classifier.
+
+        The scorer finds the character n-grams of a message that have a nonzero
+        weight and adds their weights up directly, without building a sparse
+        matrix. The weights are added in column order, as the sparse
+        matrix product does, so the scores are exactly those of the classifier.
+
+        :param to_features: The (vocabulary-based) converter the classifier was
+        trained with, possibly pruned.
+        :param classifier: The trained classifier.
+        """
+        vectorizer = to_features.vectorizer
+        if to_features.n_features is not None or vectorizer.analyzer != 'char':
+            raise ValueError("only vocabulary-based char n-gram features can be scored")
+        coef = classifier.logisticRegr.coef_
+        if coef.shape[0] != 1:
+            raise ValueError("only binary classifiers can be scored")
+        terms = vectorizer.get_feature_names_out()
+        #each n-gram with a nonzero weight, in column order
+        self.weights = [(terms[column], float(coef[0, column]))
+                        for column in np.flatnonzero(coef[0])]
+        #the position of each of those n-grams in the list
+        self.weightIndex = {ngram: i for i, (ngram, _) in enumerate(self.weights)}
+        self.intercept = float(classifier.logisticRegr.intercept_[0])
+        self.classes = classifier.logisticRegr.classes_
+        self.ngram_range = vectorizer.ngram_range
+        self.lowercase = vectorizer.lowercase
+        self.binary = vectorizer.binary
+
+    def decision_function(self, text: Text) -> float:
+        """Calculates the score of a message, positive for the second class.
+
+        :param text: The text of the message.
+        :return: The same score as the classifier's decision_function.
+        """
+        if self.lowercase:
+            text = text.lower()
+        #normalize white spaces as the vectorizer does
+        text = _WHITE_SPACES.sub(" ", text)
+        minN, maxN = self.ngram_range
+        score = 0.0
+        #add the weights up in column order, one at a time, as predict does
+        if len(self.weights) <= maxN * len(text):
+            #after l1 training there are usually fewer weighted n-grams than
+            #n-grams in the text, so search the text for each weighted n-gram
+            if self.binary:
+                for ngram, weight in self.weights:
+                    if ngram in text:
+                        score += weight
+            else:
+                for ngram, weight in self.weights:
+                    count = _count_overlapping(text, ngram)
+                    if count:
+                        score += count * weight
+        else:
+            #otherwise look each n-gram of the text up
+            ngramCounts = Counter(text[i:i + n]
+                                  for n in range(minN, maxN + 1)
+                                  for i in range(len(text) - n + 1))
+            weightIndex = self.weightIndex
+            for i, count in sorted((weightIndex[ngram], count)
+                                   for ngram, count in ngramCounts.items() if ngram in weightIndex):
+                score += (1 if self.binary else count) * self.weights[i][1]
+        return score + self.intercept
+
+    def predict(self, text: Text) -> int:
+        """Predicts the label index of a message.
+
+        :param text: The text of the message.
+        :return: The same label index as the classifier's predict.
+        """
+        return self.classes[int(self.decision_function(text) > 0)]
+
+
+class PredictionCache:
+    def __init__(self,
+                 to_features: TextToFeatures,
+                 classifier: Classifier,
+                 maxsize=100000,
+                 ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """Initializes a thread-safe cache of the predictions of a trained
+        converter and classifier, for messages that are sent many times.
+
+        Messages are keyed by a hash of their text, lowercased and with white
+        space runs collapsed, as the vectorizers do before extracting n-grams.
+        Messages with the same key thus have the same features, and the cached
+        predictions are exactly those of the classifier.
+
+        :param to_features: The converter the classifier was trained with.
+        :param classifier: The trained classifier.
+        :param maxsize: The maximum number of predictions to keep. When it is
+        exceeded, the least recently used prediction is evicted.
+        :param ttl: If not None, the number of seconds after which a prediction
+        expires.
+        :param clock: The function that returns the current time in seconds.
+        """
+        self.to_features = to_features
+        self.classifier = classifier
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        #the (prediction, expiry time) of each key, least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text: Text) -> bytes:
+        """Returns the cache key of a message: a hash of its normalized text."""
+        text = _WHITE_SPACES.sub(" ", text.lower())
+        return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def predict(self, texts: Sequence[Text]) -> np.ndarray:
+        """Predicts the label indices of a batch of messages, classifying only
+        the messages whose predictions are not cached, and each distinct one of
+        those only once. Repeats of a message within the batch count as hits.
+
+        :param texts: The texts of the messages.
+        :return: The same label indices as the classifier's predict.
+        """
+        keys = [self.key(text) for text in texts]
+        predictions = [None] * len(texts)
+        #the position in the batch of each key that was not found
+        missing = {}
+        with self.lock:
+            now = self.clock()
+            for i, key in enumerate(keys):
+                entry = self.entries.get(key)
+                if entry is not None and entry[1] <= now:
+                    del self.entries[key]
+                    entry = None
+                if key in missing:
+                    #a repeat of a message earlier in the batch
+                    self.hits += 1
+                elif entry is None:
+                    missing[key] = i
+                    self.misses += 1
+                else:
+                    self.entries.move_to_end(key)
+                    predictions[i] = entry[0]
+                    self.hits += 1
+        if missing:
+            missingPredictions = self.classifier.predict(
+                self.to_features([texts[i] for i in missing.values()]))
+            found = dict(zip(missing, missingPredictions))
+            with self.lock:
+                expiry = float("inf") if self.ttl is None else self.clock() + self.ttl
+                for key, prediction in found.items():
+                    self.entries[key] = (prediction, expiry)
+                    self.entries.move_to_end(key)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+            for i, key in enumerate(keys):
+                if predictions[i] is None:
+                    predictions[i] = found[key]
+        return np.array(predictions, dtype=self.classifier.logisticRegr.classes_.dtype)
+
+    def clear(self) -> None:
+        """Removes all predictions, keeping the statistics."""
+        with self.lock:
+            self.entries.clear()
+
+    def info(self) -> dict:
+        """Returns the "hits", "misses", "hit_rate", "evictions", "size" and
+        "maxsize" of the cache.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "evictions": self.evictions,
+                    "size": len(self.entries), "maxsize": self.maxsize}
+
+
+class CascadeClassifier:
+    def __init__(self,
+                 cheap_features: TextToFeatures,
+                 cheap_classifier: Classifier,
+                 full_features: TextToFeatures,
+                 full_classifier: Classifier,
+                 band=(0.02, 0.98)):
+        """Initializes a two-stage classifier from two trained binary models.
+
+        Every message is first scored by a cheap model, e.g., on word unigrams
+        and bigrams. Only the messages it is uncertain about, those whose
+        probability of the second label is inside the band, are converted to
+        the features of the full model (e.g., character 1-6-grams) and
+        classified by it.
+
+        :param cheap_features: The converter the cheap classifier was trained
+        with.
+        :param cheap_classifier: The trained cheap classifier.
+        :param full_features: The converter the full classifier was trained
+        with.
+        :param full_classifier: The trained full classifier.
+        :param band: The (lowest, highest) probability of the second label for
+        which the full classifier is used. A wider band is more accurate, and
+        slower.
+        """
+        if len(cheap_classifier.logisticRegr.classes_) != 2:
+            raise ValueError("only binary classifiers can be cascaded")
+        self.cheap_features = cheap_features
+        self.cheap_classifier = cheap_classifier
+        self.full_features = full_features
+        self.full_classifier = full_classifier
+        self.band = band
+        self.messageCount = 0
+        self.routedCount = 0
+
+    def predict(self, texts: Sequence[Text]) -> np.ndarray:
+        """Predicts the label indices of the given messages.
+
+        :param texts: The texts of the messages.
+        :return: A prediction vector, where each entry represents a label.
+        """
+        classes = self.cheap_classifier.logisticRegr.classes_
+        if len(texts) == 0:
+            return classes[:0]
+        probabilities = self.cheap_classifier.predict_proba(self.cheap_features(texts))[:, 1]
+        predictionVector = classes[(probabilities > 0.5).astype(int)]
+        low, high = self.band
+        routed = np.flatnonzero((probabilities >= low) & (probabilities <= high))
+        if len(routed):
+            predictionVector[routed] = self.full_classifier.predict(
+                self.full_features([texts[i] for i in routed]))
+        self.messageCount += len(texts)
+        self.routedCount += len(routed)
+        return predictionVector
+
+    def routed_fraction(self) -> float:
+        """Returns the fraction of the messages predicted so far that were
+        classified by the full classifier.
+        """
+        return self.routedCount / self.messageCount if self.messageCount else 0.0
+
+
+def save_model(model_path: Text,
+               to_features: TextToFeatures,
+               to_labels: TextToLabels,
+               classifier: Classifier,
+               prune_features=True) -> None:
+    """Writes a trained converter, label encoder and classifier to a single
+    file that load_model can read back quickly.
+
+    The file starts with MODEL_MAGIC, the format version and the length of a
+    JSON header describing the model, followed by the header and by raw arrays
+    (aligned to 64 bytes): the vocabulary as a table of strings in column
+    (i.e. sorted) order, stored as UTF-8 and separated by a character that
+    occurs in none of them, and the coefficients and intercepts of the
+    classifier.
+
+    :param model_path: The path of the file.
+    :param to_features: The converter the classifier was trained with.
+    :param to_labels: The label encoder the classifier was trained with.
+    :param classifier: The trained classifier.
+    :param prune_features: If True, features with zero weight are left out
+    (see prune). Predictions are the same either way.
+    """
+    if prune_features and to_features.n_features is None:
+        to_features, classifier = prune(to_features, classifier)
+    arrays = {
+        "coef": np.ascontiguousarray(classifier.logisticRegr.coef_, dtype=np.float64),
+        "intercept": np.ascontiguousarray(classifier.logisticRegr.intercept_, dtype=np.float64),
+    }
+    vectorizerParams = {name: value for name, value in to_features.vectorizer.get_params().items()
+                        if name not in ("vocabulary", "dtype")}
+    #the settings that training would continue with
+    model = classifier.logisticRegr
+    classifierParams = {"penalty": model.penalty}
+    if classifier.incremental:
+        classifierParams["alpha"] = model.alpha
+    else:
+        classifierParams["C"] = model.C
+    if to_features.n_features is None:
+        terms = to_features.vectorizer.get_feature_names_out()
+        separator = _unused_character(terms)
+        arrays["terms"] = np.frombuffer(separator.join(terms).encode('utf-8'), dtype=np.uint8)
+    header = {
+        "n_features": to_features.n_features,
+        "term_separator": None if to_features.n_features is not None else separator,
+        "n_terms": None if to_features.n_features is not None else len(terms),
+        "vectorizer": vectorizerParams,
+        "labels": [str(label) for label in to_labels.encoder.classes_],
+        "incremental": classifier.incremental,
+        "classifier": classifierParams,
+        #the number of updates so far, which sets the incremental learning rate
+        "updates": model.t_ if classifier.incremental else None,
+        "classes": classifier.logisticRegr.classes_.tolist(),
+        "arrays": {},
+    }
+    #lay the arrays out after the header, each aligned for memory-mapping
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {"offset": offset, "dtype": array.dtype.str, "shape": array.shape}
+        offset += _aligned(array.nbytes)
+    headerBytes = json.dumps(header).encode('utf-8')
+    dataStart = _aligned(len(MODEL_MAGIC) + 8 + len(headerBytes))
+    with open(model_path, 'wb') as modelFile:
+        modelFile.write(MODEL_MAGIC)
+        modelFile.write(struct.pack("<II", MODEL_VERSION, len(headerBytes)))
+        modelFile.write(headerBytes)
+        for name, array in arrays.items():
+            modelFile.seek(dataStart + header["arrays"][name]["offset"])
+            modelFile.write(array.tobytes())
+        #make sure the file covers the padding of the last array
+        modelFile.truncate(dataStart + offset)
+
+
+def load_model(model_path: Text, mmap=True) -> Tuple[TextToFeatures, TextToLabels, Classifier]:
+    """Reads a model written by save_model.
+
+    :param model_path: The path of the file.
+    :param mmap: If True, the coefficients are memory-mapped from the file
+    instead of read into memory. Ignored for incremental classifiers, whose
+    coefficients must be writable to continue training.
+    :return: The converter, the label encoder and the classifier.
+    """
+    with open(model_path, 'rb') as modelFile:
+        if modelFile.read(len(MODEL_MAGIC)) != MODEL_MAGIC:
+            raise ValueError("{} is not a model file".format(model_path))
+        version, headerLength = struct.unpack("<II", modelFile.read(8))
+        if version != MODEL_VERSION:
+            raise ValueError("unsupported model file version {}".format(version))
+        header = json.loads(modelFile.read(headerLength).decode('utf-8'))
+        dataStart = _aligned(len(MODEL_MAGIC) + 8 + headerLength)
+        arrays = {}
+        for name, layout in header["arrays"].items():
+            dtype = np.dtype(layout["dtype"])
+            shape = tuple(layout["shape"])
+            if mmap and name == "coef" and not header["incremental"]:
+                arrays[name] = np.memmap(model_path, dtype=dtype, mode='r',
+                                         offset=dataStart + layout["offset"], shape=shape)
+            else:
+                modelFile.seek(dataStart + layout["offset"])
+                count = int(np.prod(shape))
+                arrays[name] = np.fromfile(modelFile, dtype=dtype, count=count).reshape(shape)
+
+    vectorizerParams = header["vectorizer"]
+    vectorizerParams["ngram_range"] = tuple(vectorizerParams["ngram_range"])
+    if header["n_features"] is not None:
+        to_features = TextToFeatures(None, n_features=header["n_features"],
+                                     analyzer=vectorizerParams["analyzer"],
+                                     ngram_range=vectorizerParams["ngram_range"],
+                                     binary=vectorizerParams["binary"])
+    else:
+        terms = arrays["terms"].tobytes().decode('utf-8').split(header["term_separator"])
+        if header["n_terms"] == 0:
+            terms = []
+        to_features = TextToFeatures.__new__(TextToFeatures)
+        to_features.n_features = None
+        to_features.vectorizer = _fixed_vectorizer(vectorizerParams, terms)
+
+    to_labels = TextToLabels(header["labels"])
+
+    classifier = Classifier(incremental=header["incremental"], **header.get("classifier", {}))
+    model = classifier.logisticRegr
+    model.coef_ = arrays["coef"]
+    model.intercept_ = arrays["intercept"]
+    model.classes_ = np.array(header["classes"])
+    model.n_features_in_ = model.coef_.shape[1]
+    if header.get("updates") is not None:
+        model.t_ = header["updates"]
+    return to_features, to_labels, classifier
+
+
+def _unused_character(terms: Sequence[Text]) -> Text:
+    """Returns a character that occurs in none of the terms."""
+    used = set().union(*terms)
+    return next(chr(code) for code in itertools.count() if chr(code) not in used)
+
+
+def _aligned(size: int) -> int:
+    """Rounds a size up to the alignment of arrays in model files."""
+    return -(-size // MODEL_ALIGNMENT) * MODEL_ALIGNMENT
+
+
+def iter_predict(to_features: TextToFeatures,
+                 classifier: Classifier,
+                 texts: Iterable[Text],
+                 processes: Optional[int] = None,
+                 chunk_size=TRANSFORM_CHUNK_SIZE) -> Iterator[NDArray]:
+    """Generates the predictions for consecutive chunks of texts, which are
+    featurized and classified in a pool of worker processes, so that no
+    feature matrix has to leave the workers. As in TextToFeatures.iter_transform,
+    the texts are read as they are needed.
+
+    :param to_features: The converter the classifier was trained with.
+    :param classifier: The trained classifier.
+    :param texts: The texts.
+    :param processes: The number of worker processes. If None, the number of
+    CPUs is used.
+    :param chunk_size: The number of texts in a chunk.
+    :return: An iterator over the prediction vectors of the chunks, in order.
+    """
+    with Pool(processes, initializer=_set_worker_model, initargs=(to_features, classifier)) as pool:
+        yield from _bounded_imap(pool, _predict_chunk, _batches(texts, chunk_size), processes)
+
+
+def _bounded_imap(pool: Pool, function: Callable, items: Iterable,
+                  processes: Optional[int]) -> Iterator:
+    """Generates function(item) for each item, in order, like pool.imap, but
+    only reads an item when fewer than two per process are outstanding, so the
+    items are not read faster than the results are consumed.
+    """
+    window = 2 * (processes or os.cpu_count() or 1)
+    pending = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(function, (item,)))
+    while pending:
+        yield pending.popleft().get()
+
+
+#the converter and classifier of a worker process of a Pool
+_workerFeatures = None
+_workerClassifier = None
+
+
+def _set_worker_model(to_features: TextToFeatures, classifier: Optional[Classifier]) -> None:
+    """Initializes a worker process with the model it uses for every chunk."""
+    global _workerFeatures, _workerClassifier
+    _workerFeatures = to_features
+    _workerClassifier = classifier
+
+
+def _transform_chunk(texts: List[Text]) -> NDArray:
+    """Converts a chunk of texts to features in a worker process."""
+    return _workerFeatures(texts)
 
 
+def _predict_chunk(texts: List[Text]) -> NDArray:
+    """Predicts the labels of a chunk of texts in a worker process."""
+    return _workerClassifier.predict(_workerFeatures(texts))
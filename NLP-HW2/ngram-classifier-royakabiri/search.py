@@ -0,0 +1,192 @@
+"""Searches the hyperparameters of the spam classifier.
+
+The training and development texts are converted to n-gram counts only once,
+over the widest n-gram range searched. Each narrower range is a selection of
+those columns, and binary features are the signs of the counts. The grid of
+regularization penalties and strengths is evaluated in parallel by worker
+processes that share the matrices. For example, to compare l1 and l2
+regularization of 1-4 and 1-6 character n-grams:
+
+    python search.py smsspam/SMSSpamCollection.train smsspam/SMSSpamCollection.devel \\
+        --ngram-range 1-4 1-6 --penalty l1 l2 --C 1 5 20
+"""
+from typing import Dict, List, Optional, Sequence, Text, Tuple
+import argparse
+import itertools
+import json
+import multiprocessing
+import time
+
+import numpy as np
+from sklearn.metrics import accuracy_score, f1_score
+
+import classify
+
+#the training and development matrices and labels shared by the workers
+_workerData = None
+
+
+class FeatureCache:
+    def __init__(self,
+                 train_texts: Sequence[Text],
+                 devel_texts: Sequence[Text],
+                 analyzer='char',
+                 ngram_range=(1, 6)):
+        """Converts training and development texts to n-gram counts once, for
+        deriving the features of narrower n-gram ranges and binary features.
+
+        :param train_texts: The training texts, which determine the vocabulary.
+        :param devel_texts: The development texts.
+        :param analyzer: Whether the n-grams are of 'char'acters or 'word's.
+        :param ngram_range: The widest (smallest, largest) n of the n-grams.
+        """
+        self.to_features = classify.TextToFeatures(train_texts, analyzer=analyzer,
+                                                   ngram_range=ngram_range, binary=False)
+        self.ngram_range = ngram_range
+        self.train_features = self.to_features(train_texts).tocsc()
+        self.devel_features = self.to_features(devel_texts).tocsc()
+        terms = self.to_features.vectorizer.get_feature_names_out()
+        #the n of the n-gram in each column
+        if analyzer == 'char':
+            self.ngramLengths = np.fromiter(map(len, terms), dtype=np.int64, count=len(terms))
+        else:
+            self.ngramLengths = np.fromiter((term.count(" ") + 1 for term in terms),
+                                            dtype=np.int64, count=len(terms))
+
+    def columns(self, ngram_range: Tuple[int, int]) -> np.ndarray:
+        """Returns the columns of the n-grams in a range within the cached one."""
+        minN, maxN = ngram_range
+        if minN < self.ngram_range[0] or maxN > self.ngram_range[1]:
+            raise ValueError("{} is not within the cached n-gram range {}".format(
+                ngram_range, self.ngram_range))
+        return np.flatnonzero((self.ngramLengths >= minN) & (self.ngramLengths <= maxN))
+
+    def features(self, ngram_range: Tuple[int, int], binary: bool):
+        """Returns the training and development matrices of the n-grams in a
+        range, as counts or, if binary, as whether each n-gram occurs. These
+        are the matrices that a TextToFeatures with the same parameters
+        produces.
+        """
+        columns = self.columns(ngram_range)
+        train = self.train_features[:, columns].tocsr()
+        devel = self.devel_features[:, columns].tocsr()
+        if binary:
+            train, devel = train.sign(), devel.sign()
+        return train, devel
+
+
+def evaluate(features: FeatureCache,
+             train_labels: np.ndarray,
+             devel_labels: np.ndarray,
+             pos_label: int,
+             ngram_range: Tuple[int, int],
+             binary: bool,
+             penalty: Text,
+             C: float) -> Dict:
+    """Trains a classifier with one configuration and evaluates it.
+
+    :return: A dict with the configuration ("ngram_range", "binary", "penalty"
+    and "C"), the "n_features" and "nonzero_features", the "f1" and "accuracy"
+    on the development data, and the "seconds" taken to select the features,
+    train and predict.
+    """
+    start = time.perf_counter()
+    train, devel = features.features(ngram_range, binary)
+    classifier = classify.Classifier(penalty=penalty, C=C)
+    classifier.train(train, train_labels)
+    predicted = classifier.predict(devel)
+    return {
+        "ngram_range": list(ngram_range),
+        "binary": binary,
+        "penalty": penalty,
+        "C": C,
+        "n_features": train.shape[1],
+        "nonzero_features": len(classifier.nonzero_features()),
+        "f1": f1_score(devel_labels, predicted, pos_label=pos_label),
+        "accuracy": accuracy_score(devel_labels, predicted),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _set_worker_data(data: Tuple) -> None:
+    global _workerData
+    _workerData = data
+
+
+def _evaluate_configuration(configuration: Tuple) -> Dict:
+    return evaluate(*_workerData, *configuration)
+
+
+def search(train_path: Text,
+           devel_path: Text,
+           ngram_ranges: Sequence[Tuple[int, int]] = ((1, 6),),
+           binaries: Sequence[bool] = (True,),
+           penalties: Sequence[Text] = ('l1',),
+           Cs: Sequence[float] = (5,),
+           analyzer='char',
+           processes: Optional[int] = None) -> List[Dict]:
+    """Evaluates every combination of the given hyperparameters.
+
+    :param train_path: The SMSSpam file to train on.
+    :param devel_path: The SMSSpam file to evaluate on.
+    :param ngram_ranges: The (smallest, largest) n of the n-grams to try.
+    :param binaries: Whether to try binary features, counts, or both.
+    :param penalties: The regularizations to try.
+    :param Cs: The inverse regularization strengths to try.
+    :param analyzer: Whether the n-grams are of 'char'acters or 'word's.
+    :param processes: The number of worker processes. If None, the number of
+    CPUs is used. If 1, configurations are evaluated in this process.
+    :return: The results of evaluate for each configuration, in grid order.
+    """
+    train_labels, train_texts = zip(*classify.read_smsspam(train_path))
+    devel_labels, devel_texts = zip(*classify.read_smsspam(devel_path))
+    widest = (min(minN for minN, _ in ngram_ranges), max(maxN for _, maxN in ngram_ranges))
+    features = FeatureCache(train_texts, devel_texts, analyzer, widest)
+    to_labels = classify.TextToLabels(train_labels)
+    data = (features, to_labels(train_labels), to_labels(devel_labels), to_labels.index("spam"))
+    configurations = list(itertools.product(ngram_ranges, binaries, penalties, Cs))
+    if processes == 1:
+        return [evaluate(*data, *configuration) for configuration in configurations]
+    #forked workers share the parent's matrices instead of copying them
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with context.Pool(processes, initializer=_set_worker_data, initargs=(data,)) as pool:
+        return pool.map(_evaluate_configuration, configurations, chunksize=1)
+
+
+def _ngram_range(text: Text) -> Tuple[int, int]:
+    minN, _, maxN = text.partition("-")
+    return int(minN), int(maxN or minN)
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("train_path", help="an SMSSpam file to train on")
+    parser.add_argument("devel_path", help="an SMSSpam file to evaluate on")
+    parser.add_argument("--analyzer", choices=["char", "word"], default="char")
+    parser.add_argument("--ngram-range", type=_ngram_range, nargs="+", default=[(1, 6)],
+                        help="n-gram ranges such as 1-6")
+    parser.add_argument("--binary", choices=["yes", "no"], nargs="+", default=["yes"],
+                        help="whether features are binary or counts")
+    parser.add_argument("--penalty", choices=["l1", "l2"], nargs="+", default=["l1"])
+    parser.add_argument("--C", type=float, nargs="+", default=[5])
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--json", help="a file to write the results to")
+    args = parser.parse_args(argv)
+    results = search(args.train_path, args.devel_path, args.ngram_range,
+                     [binary == "yes" for binary in args.binary], args.penalty, args.C,
+                     args.analyzer, args.processes)
+    print("{:>7} {:>6} {:>7} {:>8} {:>9} {:>7} {:>8} {:>8}".format(
+        "ngrams", "binary", "penalty", "C", "nonzero", "F1", "accuracy", "seconds"))
+    for result in sorted(results, key=lambda result: -result["f1"]):
+        print("{:>7} {:>6} {:>7} {:>8g} {:>9} {:>7.1%} {:>8.1%} {:>8.2f}".format(
+            "{}-{}".format(*result["ngram_range"]), "yes" if result["binary"] else "no",
+            result["penalty"], result["C"], result["nonzero_features"],
+            result["f1"], result["accuracy"], result["seconds"]))
+    if args.json is not None:
+        with open(args.json, "w") as jsonFile:
+            json.dump(results, jsonFile, indent=2)
+
+
+if __name__ == "__main__":
+    main()
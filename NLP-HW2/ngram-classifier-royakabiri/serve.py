@@ -0,0 +1,340 @@
+"""Serves spam classifier predictions over a local socket.
+
+Concurrent requests are collected into micro-batches, and each batch is
+converted to features and classified with a single call. The protocol is one
+JSON object per line: a request {"text": "..."} is answered with
+{"label": "..."}, and a request {"stats": true} is answered with the batching
+statistics. For example, to train a model and serve it on port 8765, and then
+send it the development messages from 64 concurrent connections:
+
+    python serve.py serve --train smsspam/SMSSpamCollection.train --port 8765
+    python serve.py load smsspam/SMSSpamCollection.devel --port 8765
+"""
+from typing import Dict, List, Optional, Sequence, Text, Tuple
+from collections import Counter
+import argparse
+import asyncio
+import json
+import pickle
+import time
+
+import numpy as np
+
+import classify
+
+
+class MicroBatcher:
+    def __init__(self,
+                 to_features: classify.TextToFeatures,
+                 to_labels: classify.TextToLabels,
+                 classifier: classify.Classifier,
+                 max_batch_size=64,
+                 max_wait=0.002,
+                 cache_size=0,
+                 cache_ttl: Optional[float] = None):
+        """Initializes a queue of messages that are classified in batches.
+
+        :param to_features: The converter from texts to features.
+        :param to_labels: The converter from labels to label indices.
+        :param classifier: The trained classifier.
+        :param max_batch_size: The largest number of messages in a batch.
+        :param max_wait: The longest time, in seconds, that the first message
+        of a batch waits for more messages to arrive.
+        :param cache_size: If positive, the number of predictions kept in a
+        classify.PredictionCache, so that repeated messages are not classified
+        again.
+        :param cache_ttl: The number of seconds after which a cached prediction
+        expires, or None if it does not.
+        """
+        self.to_features = to_features
+        self.to_labels = to_labels
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.cache = None
+        if cache_size > 0:
+            self.cache = classify.PredictionCache(to_features, classifier, cache_size, cache_ttl)
+        self.queue = asyncio.Queue()
+        self.task = None
+        self.stopped = False
+        #the (text, future) pairs of the batch being collected or classified
+        self.batch = []
+        self.maxQueueDepth = 0
+        self.messageCount = 0
+        #the number of batches by size, rounded up to a power of two
+        self.batchSizes = Counter()
+
+    async def predict(self, text: Text) -> Text:
+        """Queues a message and waits for its batch to be classified. Once the
+        batcher is stopped, messages are cancelled straight away.
+
+        :param text: The text of the message.
+        :return: The predicted label.
+        """
+        future = asyncio.get_running_loop().create_future()
+        if self.stopped:
+            future.cancel()
+            return await future
+        await self.queue.put((text, future))
+        self.maxQueueDepth = max(self.maxQueueDepth, self.queue.qsize())
+        return await future
+
+    def start(self) -> None:
+        """Starts classifying queued messages in the background."""
+        self.stopped = False
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+
+    def stop(self) -> None:
+        """Stops classifying queued messages. The messages still waiting for
+        their predictions, including those of a batch being classified, are
+        cancelled, as are any messages sent until the batcher is started again.
+        """
+        self.stopped = True
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        pending = self.batch
+        self.batch = []
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for _, future in pending:
+            future.cancel()
+
+    async def run(self) -> None:
+        """Classifies queued messages, one batch at a time, until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self.batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            texts = [text for text, _ in batch]
+            try:
+                #classify in a thread, so connections are served meanwhile
+                labels = await loop.run_in_executor(None, self._classify, texts)
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            finally:
+                self.batch = []
+            for (_, future), label in zip(batch, labels):
+                if not future.done():
+                    future.set_result(label)
+            self.messageCount += len(batch)
+            self.batchSizes[1 << (len(batch) - 1).bit_length()] += 1
+
+    def _classify(self, texts: List[Text]) -> List[Text]:
+        """Predicts the labels of a batch of messages."""
+        if self.cache is not None:
+            predictionVector = self.cache.predict(texts)
+        else:
+            predictionVector = self.classifier.predict(self.to_features(texts))
+        return list(self.to_labels.encoder.inverse_transform(predictionVector))
+
+    def stats(self) -> dict:
+        """Returns the current "queue_depth", the "max_queue_depth", the number
+        of "messages" and "batches" classified so far, and the
+        "batch_size_histogram", which maps each power of two to the number of
+        batches whose size rounds up to it. With a prediction cache, its
+        statistics are included as "cache".
+        """
+        stats = {
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.maxQueueDepth,
+            "messages": self.messageCount,
+            "batches": sum(self.batchSizes.values()),
+            "batch_size_histogram": {str(size): count for size, count in sorted(self.batchSizes.items())},
+        }
+        if self.cache is not None:
+            stats["cache"] = self.cache.info()
+        return stats
+
+
+async def serve(batcher: MicroBatcher,
+                host="127.0.0.1",
+                port=0,
+                path: Optional[Text] = None) -> asyncio.AbstractServer:
+    """Starts the batcher, and starts serving its predictions.
+
+    :param batcher: The batcher that classifies the messages.
+    :param host: The host to listen on, when path is None.
+    :param port: The TCP port to listen on, when path is None. If 0, a free
+    port is chosen.
+    :param path: If not None, the path of a Unix socket to listen on instead.
+    :return: The started server. Close it, and stop the batcher, when done.
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            async for line in reader:
+                try:
+                    request = json.loads(line)
+                    if request.get("stats"):
+                        response = batcher.stats()
+                    elif not isinstance(request["text"], str):
+                        raise ValueError("text must be a string")
+                    else:
+                        response = {"label": await batcher.predict(request["text"])}
+                except (ValueError, KeyError, TypeError, AttributeError) as error:
+                    response = {"error": repr(error)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    if path is None:
+        server = await asyncio.start_server(handle, host, port)
+    else:
+        server = await asyncio.start_unix_server(handle, path)
+    batcher.start()
+    return server
+
+
+async def _open(host: Text, port: int, path: Optional[Text]) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Opens a connection to a server started by serve."""
+    if path is None:
+        return await asyncio.open_connection(host, port)
+    return await asyncio.open_unix_connection(path)
+
+
+async def request_stats(host="127.0.0.1", port=0, path: Optional[Text] = None) -> dict:
+    """Asks a server for its batching statistics, as returned by
+    MicroBatcher.stats.
+    """
+    reader, writer = await _open(host, port, path)
+    writer.write(b'{"stats": true}\n')
+    stats = json.loads(await reader.readline())
+    writer.close()
+    return stats
+
+
+async def generate_load(texts: Sequence[Text],
+                        host="127.0.0.1",
+                        port=0,
+                        path: Optional[Text] = None,
+                        connections=64) -> Dict:
+    """Sends messages to a server from many concurrent connections, each
+    sending its next message as soon as the previous one is answered.
+
+    :param texts: The messages to send, spread over the connections.
+    :param host: The host of the server, when path is None.
+    :param port: The TCP port of the server, when path is None.
+    :param path: If not None, the path of the server's Unix socket.
+    :param connections: The number of concurrent connections.
+    :return: A dict with the predicted "labels" (in the order of texts), the
+    throughput in "messages_per_second", and the "latency_p50" and
+    "latency_p99" in seconds.
+    """
+    labels = [None] * len(texts)
+    latencies = []
+
+    async def send(indices: range):
+        reader, writer = await _open(host, port, path)
+        for i in indices:
+            start = time.perf_counter()
+            writer.write(json.dumps({"text": texts[i]}).encode() + b"\n")
+            labels[i] = json.loads(await reader.readline())["label"]
+            latencies.append(time.perf_counter() - start)
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[send(range(i, len(texts), connections))
+                           for i in range(min(connections, len(texts)))])
+    seconds = time.perf_counter() - start
+    return {
+        "labels": labels,
+        "messages_per_second": len(texts) / seconds,
+        "latency_p50": float(np.percentile(latencies, 50)) if latencies else 0.0,
+        "latency_p99": float(np.percentile(latencies, 99)) if latencies else 0.0,
+    }
+
+
+def train_model(smsspam_path: Text) -> Tuple[classify.TextToFeatures, classify.TextToLabels, classify.Classifier]:
+    """Trains a converter, label encoder and classifier on an SMSSpam file."""
+    labels, texts = zip(*classify.read_smsspam(smsspam_path))
+    to_features = classify.TextToFeatures(texts)
+    to_labels = classify.TextToLabels(labels)
+    classifier = classify.Classifier()
+    classifier.train(to_features(texts), to_labels(labels))
+    return to_features, to_labels, classifier
+
+
+async def _serve_forever(args: argparse.Namespace) -> None:
+    if args.model is not None:
+        try:
+            to_features, to_labels, classifier = classify.load_model(args.model)
+        except ValueError:
+            #not a model file, so a pickled model
+            with open(args.model, 'rb') as modelFile:
+                to_features, to_labels, classifier = pickle.load(modelFile)
+    else:
+        to_features, to_labels, classifier = train_model(args.train)
+    batcher = MicroBatcher(to_features, to_labels, classifier,
+                           max_batch_size=args.max_batch_size,
+                           max_wait=args.max_wait,
+                           cache_size=args.cache_size,
+                           cache_ttl=args.cache_ttl)
+    server = await serve(batcher, args.host, args.port, args.path)
+    print("serving on", args.path or server.sockets[0].getsockname())
+    try:
+        await asyncio.Event().wait()
+    finally:
+        server.close()
+        batcher.stop()
+
+
+async def _load(args: argparse.Namespace) -> None:
+    _, texts = zip(*classify.read_smsspam(args.smsspam_path))
+    texts = list(texts) * args.repeat
+    result = await generate_load(texts, args.host, args.port, args.path, args.connections)
+    del result["labels"]
+    result["server"] = await request_stats(args.host, args.port, args.path)
+    print(json.dumps(result, indent=2))
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serveParser = subparsers.add_parser("serve", help="serve a trained model")
+    model = serveParser.add_mutually_exclusive_group(required=True)
+    model.add_argument("--model", help="a file written by classify.save_model, or a pickled "
+                                       "(TextToFeatures, TextToLabels, Classifier) tuple")
+    model.add_argument("--train", help="an SMSSpam file to train a model on at startup")
+    serveParser.add_argument("--max-batch-size", type=int, default=64)
+    serveParser.add_argument("--max-wait", type=float, default=0.002,
+                             help="seconds to wait for a batch to fill")
+    serveParser.add_argument("--cache-size", type=int, default=0,
+                             help="the number of predictions to cache for repeated messages")
+    serveParser.add_argument("--cache-ttl", type=float,
+                             help="seconds after which a cached prediction expires")
+    loadParser = subparsers.add_parser("load", help="send messages to a server")
+    loadParser.add_argument("smsspam_path", help="an SMSSpam file whose messages are sent")
+    loadParser.add_argument("--connections", type=int, default=64)
+    loadParser.add_argument("--repeat", type=int, default=1,
+                            help="the number of times each message is sent")
+    for subparser in [serveParser, loadParser]:
+        subparser.add_argument("--host", default="127.0.0.1")
+        subparser.add_argument("--port", type=int, default=8765)
+        subparser.add_argument("--path", help="a Unix socket to use instead of TCP")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve_forever(args) if args.command == "serve" else _load(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import copy
+import json
+
+import numpy as np
+import pytest
+
+import benchmark
+
+
+def test_resample():
+    examples = benchmark.resample(1000, "smsspam/SMSSpamCollection.devel")
+    assert len(examples) == 1000
+    assert {label for label, _ in examples} == {"ham", "spam"}
+    assert examples == benchmark.resample(1000, "smsspam/SMSSpamCollection.devel")
+
+
+def test_stage_peak_rss():
+    if not benchmark._reset_peak_rss():
+        pytest.skip("the peak resident memory cannot be reset here")
+    # a stage after a large allocation does not inherit its peak
+    block = np.ones(2 ** 26 // 8)
+    block_peak = benchmark._peak_rss_mb()
+    del block
+    benchmark._reset_peak_rss()
+    assert benchmark._peak_rss_mb() < block_peak - 32
+
+
+def test_benchmark(tmp_path):
+    output_path = tmp_path / "baseline.json"
+    status = benchmark.main(["--sizes", "500", "1000", "--smsspam-path", "smsspam/SMSSpamCollection.devel",
+                             "--output", str(output_path)])
+    assert status == 0
+    baseline = json.loads(output_path.read_text())
+
+    # each size is measured in its own process
+    assert list(baseline["results"]) == ["500", "1000"]
+    for result in baseline["results"].values():
+        assert result["vocabulary_size"] > 0
+        assert result["fit_seconds"] > 0
+        assert result["predict_messages_per_second"] > 0
+        assert list(result["peak_rss_mb"]) == ["resample", "fit", "transform", "labels", "train", "predict"]
+
+    # a run is not a regression of itself, but slower stages and failures are
+    assert benchmark.compare(baseline, baseline) == []
+    current = copy.deepcopy(baseline)
+    current["results"]["500"]["predict_messages_per_second"] /= 2
+    current["results"]["500"]["peak_rss_mb"]["train"] *= 2
+    current["results"]["1000"] = {"error": "exit status -9: "}
+    regressions = benchmark.compare(baseline, current)
+    assert len(regressions) == 3
+    assert regressions[0].startswith("500: predict_messages_per_second")
@@ -1,3 +1,7 @@
+import gzip
+import itertools
+import pickle
+
 import numpy as np
 import pytest
 from sklearn.metrics import f1_score, accuracy_score
@@ -10,6 +14,25 @@ def set_seeds():
     np.random.seed(42)
 
 
+def train_model(**feature_params):
+    train_examples = classify.read_smsspam("smsspam/SMSSpamCollection.train")
+    train_labels, train_texts = zip(*train_examples)
+    devel_examples = classify.read_smsspam("smsspam/SMSSpamCollection.devel")
+    _, devel_texts = zip(*devel_examples)
+    to_features = classify.TextToFeatures(train_texts, **feature_params)
+    to_labels = classify.TextToLabels(train_labels)
+    classifier = classify.Classifier()
+    classifier.train(to_features(train_texts), to_labels(train_labels))
+    return to_features, to_labels, classifier, devel_texts
+
+
+@pytest.fixture(scope="module")
+def model():
+    # the default char n-gram model, trained once for all the tests that use it
+    np.random.seed(42)
+    return train_model()
+
+
 def test_read_smsspam():
     # keep a counter here (instead of enumerate) in case the iterator is empty
     count = 0
@@ -26,6 +49,26 @@ def test_read_smsspam():
     assert count == 3345
 
 
+def test_read_smsspam_batches(tmp_path):
+    examples = list(classify.read_smsspam("smsspam/SMSSpamCollection.train"))
+
+    # the reader is lazy
+    assert next(classify.read_smsspam("smsspam/SMSSpamCollection.train")) == \
+        examples[0]
+
+    # gzipped files give the same examples
+    gz_path = str(tmp_path / "SMSSpamCollection.train.gz")
+    with open("smsspam/SMSSpamCollection.train", "rb") as in_file:
+        with gzip.open(gz_path, "wb") as out_file:
+            out_file.write(in_file.read())
+    assert list(classify.read_smsspam(gz_path)) == examples
+
+    # batches hold consecutive examples
+    batches = list(classify.read_smsspam(gz_path, batch_size=1000))
+    assert [len(batch) for batch in batches] == [1000, 1000, 1000, 345]
+    assert [example for batch in batches for example in batch] == examples
+
+
 def test_features():
     # get the texts from the training data
     examples = classify.read_smsspam("smsspam/SMSSpamCollection.train")
@@ -68,7 +111,32 @@ def test_labels():
                   [ham_index, spam_index, spam_index])
 
 
-def test_prediction(capsys, min_f1=0.89, min_accuracy=0.97):
+def test_hashed_features():
+    to_features = classify.TextToFeatures(None, n_features=2 ** 18)
+
+    # no training texts are needed, and batches are converted independently
+    texts = ["There are some things that I need to send to you.", "Hello!"]
+    features = to_features(texts)
+    assert features.shape == (2, 2 ** 18)
+    assert (to_features(texts[1:]) != features[1:]).nnz == 0
+
+    # index() gives the hashed column of a feature
+    indices = [to_features.index(f) for f in ["need", "to you"]]
+    assert len(set(indices)) > 1
+    row_indices, col_indices = features[:, indices].nonzero()
+    assert np.all(row_indices == 0)
+    assert len(col_indices) == 2
+    assert np.array_equal(to_features(["need"]).nonzero()[1],
+                          sorted({to_features.index(f) for f in [
+                              "n", "e", "d", "ne", "ee", "ed", "nee", "eed",
+                              "need"]}))
+
+
+def test_hashed_prediction(capsys):
+    test_prediction(capsys, n_features=2 ** 20)
+
+
+def test_prediction(capsys, min_f1=0.89, min_accuracy=0.97, n_features=None):
     # get texts and labels from the training data
     train_examples = classify.read_smsspam("smsspam/SMSSpamCollection.train")
     train_labels, train_texts = zip(*train_examples)
@@ -78,7 +146,7 @@ def test_prediction(capsys, min_f1=0.89, min_accuracy=0.97):
     devel_labels, devel_texts = zip(*devel_examples)
 
     # create the feature extractor and label encoder
-    to_features = classify.TextToFeatures(train_texts)
+    to_features = classify.TextToFeatures(train_texts, n_features=n_features)
     to_labels = classify.TextToLabels(train_labels)
 
     # train the classifier on the training data
@@ -109,3 +177,239 @@ def test_prediction(capsys, min_f1=0.89, min_accuracy=0.97):
 @pytest.mark.xfail
 def test_very_accurate_prediction():
     test_prediction(capsys=None, min_f1=0.94, min_accuracy=0.98)
+
+
+def test_streaming_training(min_f1=0.89, min_accuracy=0.97):
+    # hashed features need no pass over the training data
+    to_features = classify.TextToFeatures(None, n_features=2 ** 20)
+    to_labels = classify.TextToLabels(["ham", "spam"])
+    classifier = classify.Classifier(incremental=True)
+
+    # train on the first half of the data, then warm-start on the second half
+    batches = classify.read_smsspam("smsspam/SMSSpamCollection.train",
+                                    batch_size=500)
+    classify.train_stream(classifier, to_features, to_labels,
+                          itertools.islice(batches, 3))
+    first_coef = classifier.logisticRegr.coef_.copy()
+    classifier = pickle.loads(pickle.dumps(classifier))
+    classify.train_stream(classifier, to_features, to_labels, batches)
+    assert not np.array_equal(first_coef, classifier.logisticRegr.coef_)
+
+    devel_examples = classify.read_smsspam("smsspam/SMSSpamCollection.devel")
+    devel_labels, devel_texts = zip(*devel_examples)
+    predicted_indices = classifier.predict(to_features(devel_texts))
+    devel_indices = to_labels(devel_labels)
+    spam_label = to_labels.index("spam")
+    assert f1_score(devel_indices, predicted_indices, pos_label=spam_label) > min_f1
+    assert accuracy_score(devel_indices, predicted_indices) > min_accuracy
+
+    # the regularization strength of incremental training can be set
+    assert classify.Classifier(incremental=True, alpha=1e-3).logisticRegr.alpha == 1e-3
+
+    # batch training is not incremental
+    with pytest.raises(ValueError):
+        classify.Classifier().train_batch(to_features(devel_texts[:2]),
+                                          devel_indices[:2])
+
+
+def test_prune(model):
+    to_features, to_labels, classifier, devel_texts = model
+
+    pruned_features, pruned_classifier = classify.prune(to_features, classifier)
+
+    # only features with nonzero weights are kept
+    columns = classifier.nonzero_features()
+    assert pruned_features(devel_texts).shape == (len(devel_texts), len(columns))
+    assert len(columns) < len(to_features.vectorizer.vocabulary_) / 10
+    assert np.all(pruned_classifier.logisticRegr.coef_ != 0)
+
+    # and predictions do not change
+    assert np.array_equal(
+        classifier.predict(to_features(devel_texts)),
+        pruned_classifier.predict(pruned_features(devel_texts)))
+
+
+def test_parallel_features(model):
+    to_features, to_labels, classifier, devel_texts = model
+
+    # the parallel features are identical to the serial ones
+    serial = to_features(devel_texts)
+    parallel = to_features.transform_parallel(iter(devel_texts), processes=2, chunk_size=100)
+    assert parallel.shape == serial.shape
+    assert np.array_equal(parallel.indptr, serial.indptr)
+    assert np.array_equal(parallel.indices, serial.indices)
+    assert np.array_equal(parallel.data, serial.data)
+
+    # chunks are generated in order
+    chunks = list(to_features.iter_transform(devel_texts, processes=2, chunk_size=100))
+    assert [chunk.shape[0] for chunk in chunks[:-1]] == [100] * (len(chunks) - 1)
+    predictions = classify.iter_predict(to_features, classifier, devel_texts, processes=2, chunk_size=100)
+    assert np.array_equal(np.concatenate(list(predictions)), classifier.predict(serial))
+
+    # the texts are only read as the chunks are consumed
+    read = [0]
+
+    def texts():
+        for text in itertools.cycle(devel_texts):
+            read[0] += 1
+            yield text
+
+    chunks = classify.iter_predict(to_features, classifier, texts(), processes=2, chunk_size=100)
+    next(chunks)
+    next(chunks)
+    assert read[0] <= 6 * 100
+    chunks.close()
+
+
+def test_prediction_cache(model):
+    to_features, to_labels, classifier, devel_texts = model
+    expected = classifier.predict(to_features(devel_texts))
+    now = [0.0]
+    cache = classify.PredictionCache(to_features, classifier, maxsize=len(devel_texts), ttl=60,
+                                     clock=lambda: now[0])
+
+    # repeats within a batch are classified once, and count as hits
+    batch = devel_texts[:100] * 3
+    assert np.array_equal(cache.predict(batch), np.tile(expected[:100], 3))
+    distinct = len(set(classify.PredictionCache.key(text) for text in devel_texts[:100]))
+    assert cache.info()["misses"] == distinct
+    assert cache.info()["hits"] == len(batch) - distinct
+
+    # differences in case and white space do not change the features, so
+    # they are served from the cache, mixed with new messages
+    variants = [" ".join(text.upper().split(" ")).replace(" ", "  ") for text in devel_texts]
+    assert np.array_equal(cache.predict(variants), expected)
+    assert cache.info()["misses"] == len(set(map(classify.PredictionCache.key, devel_texts)))
+    assert cache.predict([]).shape == (0,)
+
+    # predictions expire after the ttl
+    now[0] = 61
+    misses = cache.info()["misses"]
+    assert np.array_equal(cache.predict(devel_texts[:10]), expected[:10])
+    assert cache.info()["misses"] == misses + 10
+
+    # and the least recently used predictions are evicted beyond maxsize
+    cache.maxsize = 5
+    cache.predict(devel_texts[10:20])
+    info = cache.info()
+    assert info["size"] == 5
+    assert info["evictions"] > 0
+    assert 0 < info["hit_rate"] < 1
+
+
+def test_cascade(capsys, f1_tolerance=0.01, accuracy_tolerance=0.005):
+    train_examples = classify.read_smsspam("smsspam/SMSSpamCollection.train")
+    train_labels, train_texts = zip(*train_examples)
+    devel_examples = classify.read_smsspam("smsspam/SMSSpamCollection.devel")
+    devel_labels, devel_texts = zip(*devel_examples)
+    to_labels = classify.TextToLabels(train_labels)
+    word_features = classify.TextToFeatures(train_texts, analyzer='word', ngram_range=(1, 2))
+    word_classifier = classify.Classifier()
+    word_classifier.train(word_features(train_texts), to_labels(train_labels))
+    char_features = classify.TextToFeatures(train_texts)
+    char_classifier = classify.Classifier()
+    char_classifier.train(char_features(train_texts), to_labels(train_labels))
+
+    # word features are mostly, but not all, whole words
+    assert word_features.index("free") is not None
+    assert word_features.index("call you") is not None
+    probabilities = word_classifier.predict_proba(word_features(devel_texts))
+    assert np.allclose(probabilities.sum(axis=1), 1)
+
+    cascade = classify.CascadeClassifier(word_features, word_classifier,
+                                         char_features, char_classifier)
+    predicted_indices = cascade.predict(devel_texts)
+    char_indices = char_classifier.predict(char_features(devel_texts))
+    devel_indices = to_labels(devel_labels)
+    spam_label = to_labels.index("spam")
+    f1 = f1_score(devel_indices, predicted_indices, pos_label=spam_label)
+    accuracy = accuracy_score(devel_indices, predicted_indices)
+
+    with capsys.disabled():
+        msg = "\n{:.1%} F1 and {:.1%} accuracy with {:.1%} of messages routed to stage two"
+        print(msg.format(f1, accuracy, cascade.routed_fraction()))
+
+    # only a few messages are classified by the char n-gram model
+    assert 0 < cascade.routed_fraction() < 0.2
+    # and performance stays close to that of the char n-gram model alone
+    assert f1 > f1_score(devel_indices, char_indices, pos_label=spam_label) - f1_tolerance
+    assert accuracy > accuracy_score(devel_indices, char_indices) - accuracy_tolerance
+
+    # the full band routes every message
+    everything = classify.CascadeClassifier(word_features, word_classifier,
+                                            char_features, char_classifier, band=(0, 1))
+    assert np.array_equal(everything.predict(devel_texts), char_indices)
+    assert everything.routed_fraction() == 1
+    assert everything.predict([]).shape == (0,)
+
+
+def test_message_scorer(model):
+    to_features, to_labels, classifier, devel_texts = model
+
+    # scores and predictions match the classifier exactly
+    scorer = classify.MessageScorer(to_features, classifier)
+    devel_features = to_features(devel_texts)
+    assert np.array_equal(
+        [scorer.decision_function(text) for text in devel_texts],
+        classifier.logisticRegr.decision_function(devel_features))
+    assert np.array_equal([scorer.predict(text) for text in devel_texts],
+                          classifier.predict(devel_features))
+
+    # hashed features cannot be looked up by n-gram
+    with pytest.raises(ValueError):
+        classify.MessageScorer(classify.TextToFeatures(None, n_features=2 ** 10),
+                               classifier)
+
+
+@pytest.mark.parametrize("feature_params,prune_features", [
+    (None, True), (None, False), ({"n_features": 2 ** 16}, True),
+    ({"n_features": 2 ** 16, "analyzer": "word", "ngram_range": (1, 2)}, True),
+    ({"n_features": 2 ** 16, "binary": False}, True)])
+def test_save_load_model(tmp_path, model, feature_params, prune_features):
+    if feature_params is None:
+        to_features, to_labels, classifier, devel_texts = model
+    else:
+        to_features, to_labels, classifier, devel_texts = train_model(**feature_params)
+
+    model_path = str(tmp_path / "model.smsmodel")
+    classify.save_model(model_path, to_features, to_labels, classifier,
+                        prune_features=prune_features)
+    loaded_features, loaded_labels, loaded_classifier = \
+        classify.load_model(model_path)
+
+    # the loaded model makes the same predictions with the same labels
+    assert np.array_equal(
+        loaded_classifier.predict(loaded_features(devel_texts)),
+        classifier.predict(to_features(devel_texts)))
+    assert loaded_labels.index("spam") == to_labels.index("spam")
+    assert isinstance(loaded_classifier.logisticRegr.coef_, np.memmap)
+    if to_features.n_features is not None:
+        assert loaded_features.vectorizer.get_params() == \
+            to_features.vectorizer.get_params()
+    if feature_params is None and not prune_features:
+        assert loaded_features.vectorizer.vocabulary_ == \
+            to_features.vectorizer.vocabulary_
+
+    # other files are rejected
+    with pytest.raises(ValueError):
+        classify.load_model("smsspam/SMSSpamCollection.devel")
+
+
+def test_save_load_incremental_model(tmp_path):
+    to_features = classify.TextToFeatures(None, n_features=2 ** 16)
+    to_labels = classify.TextToLabels(["ham", "spam"])
+    classifier = classify.Classifier(incremental=True, alpha=1e-3)
+    batches = classify.read_smsspam("smsspam/SMSSpamCollection.train", batch_size=500)
+    classify.train_stream(classifier, to_features, to_labels, itertools.islice(batches, 2))
+
+    model_path = str(tmp_path / "model.smsmodel")
+    classify.save_model(model_path, to_features, to_labels, classifier)
+    loaded_features, loaded_labels, loaded_classifier = classify.load_model(model_path)
+
+    # the loaded classifier keeps its settings, and training continues from
+    # its weights as it would have in memory
+    assert loaded_classifier.logisticRegr.alpha == 1e-3
+    labels, texts = zip(*next(batches))
+    for trained in [classifier, loaded_classifier]:
+        trained.train_batch(to_features(texts), to_labels(labels))
+    assert np.allclose(loaded_classifier.logisticRegr.coef_, classifier.logisticRegr.coef_)
@@ -0,0 +1,43 @@
+import numpy as np
+
+import classify
+import search
+
+
+def test_feature_cache():
+    _, train_texts = zip(*classify.read_smsspam("smsspam/SMSSpamCollection.train"))
+    _, devel_texts = zip(*classify.read_smsspam("smsspam/SMSSpamCollection.devel"))
+    features = search.FeatureCache(train_texts, devel_texts)
+
+    # narrower ranges and binary features are those of a fitted converter
+    for ngram_range, binary in [((1, 6), False), ((2, 4), True)]:
+        to_features = classify.TextToFeatures(train_texts, ngram_range=ngram_range, binary=binary)
+        train, devel = features.features(ngram_range, binary)
+        for texts, matrix in [(train_texts, train), (devel_texts, devel)]:
+            expected = to_features(texts)
+            assert matrix.shape == expected.shape
+            assert (matrix != expected).nnz == 0
+
+
+def test_search():
+    results = search.search("smsspam/SMSSpamCollection.train",
+                            "smsspam/SMSSpamCollection.devel",
+                            ngram_ranges=[(1, 3), (1, 5)],
+                            penalties=["l1", "l2"],
+                            processes=2)
+
+    # every configuration is reported, in grid order
+    assert [(tuple(result["ngram_range"]), result["penalty"]) for result in results] == [
+        ((1, 3), "l1"), ((1, 3), "l2"), ((1, 5), "l1"), ((1, 5), "l2")]
+    for result in results:
+        assert 0.8 < result["f1"] <= 1
+        assert 0.9 < result["accuracy"] <= 1
+        assert result["seconds"] > 0
+        assert result["nonzero_features"] <= result["n_features"]
+
+    # and workers produce the same results as this process
+    serial = search.search("smsspam/SMSSpamCollection.train",
+                           "smsspam/SMSSpamCollection.devel",
+                           ngram_ranges=[(1, 3)], penalties=["l2"], processes=1)
+    assert serial[0]["f1"] == results[1]["f1"]
+    assert np.isclose(serial[0]["accuracy"], results[1]["accuracy"])
@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+import classify
+import serve
+
+
+@pytest.mark.parametrize("cache_size", [0, 1000])
+def test_micro_batching_server(cache_size):
+    to_features, to_labels, classifier = serve.train_model(
+        "smsspam/SMSSpamCollection.train")
+    _, devel_texts = zip(*classify.read_smsspam("smsspam/SMSSpamCollection.devel"))
+    devel_texts = devel_texts[:300] * 2
+    expected_labels = to_labels.encoder.inverse_transform(
+        classifier.predict(to_features(devel_texts)))
+
+    async def run():
+        batcher = serve.MicroBatcher(to_features, to_labels, classifier,
+                                     max_batch_size=16, max_wait=0.01,
+                                     cache_size=cache_size)
+        server = await serve.serve(batcher)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            result = await serve.generate_load(devel_texts, port=port,
+                                               connections=32)
+            stats = await serve.request_stats(port=port)
+        finally:
+            server.close()
+            batcher.stop()
+        return result, stats
+
+    result, stats = asyncio.run(run())
+
+    # every message gets the label of the one-shot prediction
+    assert np.array_equal(result["labels"], expected_labels)
+    assert result["messages_per_second"] > 0
+
+    # concurrent messages are classified together, within the size limit
+    assert stats["messages"] == len(devel_texts)
+    assert stats["batches"] < len(devel_texts)
+    assert max(int(size) for size in stats["batch_size_histogram"]) <= 16
+    assert stats["queue_depth"] == 0
+
+    # with a cache, each repeated message is served from it
+    if cache_size:
+        assert stats["cache"]["size"] <= len(devel_texts) // 2
+        assert stats["cache"]["hits"] >= len(devel_texts) // 2
+    else:
+        assert "cache" not in stats
+
+
+def test_stop_cancels_waiting_messages():
+    to_features = classify.TextToFeatures(["free prize", "see you later"])
+    to_labels = classify.TextToLabels(["spam", "ham"])
+    classifier = classify.Classifier()
+    classifier.train(to_features(["free prize", "see you later"]), to_labels(["spam", "ham"]))
+
+    async def run():
+        batcher = serve.MicroBatcher(to_features, to_labels, classifier,
+                                     max_batch_size=2, max_wait=0)
+        classified = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        def slow_classify(texts):
+            loop.call_soon_threadsafe(classified.set)
+            time.sleep(0.2)
+            return ["ham"] * len(texts)
+
+        batcher._classify = slow_classify
+        predictions = [asyncio.ensure_future(batcher.predict("hi {}".format(i)))
+                       for i in range(5)]
+        batcher.start()
+        # stop while the first batch is classified and the rest are queued
+        await classified.wait()
+        batcher.stop()
+        # as are the messages sent after stopping
+        predictions.append(asyncio.ensure_future(batcher.predict("bye")))
+        return await asyncio.wait_for(
+            asyncio.gather(*predictions, return_exceptions=True), 1)
+
+    results = asyncio.run(run())
+    assert len(results) == 6
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
@@ -1,4 +1,7 @@
-from typing import Iterator, Sequence, Text, Tuple, Union
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Text, Tuple, Union
+import argparse
+import itertools
+import time
 
 import numpy as np
 from scipy.sparse import spmatrix
@@ -6,7 +9,7 @@ import re
 from sklearn.feature_extraction import DictVectorizer
 from sklearn import preprocessing
 from sklearn.linear_model import LogisticRegression
-from scipy.sparse import coo_matrix, vstack
+from scipy.sparse import coo_matrix, csr_matrix, vstack
 
 NDArray = Union[np.ndarray, spmatrix]
 TokenSeq = Sequence[Text]
@@ -160,17 +163,27 @@ class Classifier(object):
         """
         return self.encoder.transform([label])[0]
 
-    def predict(self, tokens: TokenSeq) -> PosSeq:
+    def predict(self, tokens: TokenSeq, decoder="viterbi", beam_width=4) -> PosSeq:
         """Predicts part-of-speech tags for the sequence of tokens.
 
-        This method delegates to either `predict_greedy` or `predict_viterbi`.
-        The implementer may decide which one to delegate to.
+        This method delegates to `predict_greedy`, `predict_beam` or
+        `predict_viterbi`.
 
         :param tokens: A sequence of tokens representing a sentence.
+        :param decoder: "greedy", "beam" or "viterbi". Viterbi scores all
+        tokens in one call, so it is faster as well as more accurate than
+        greedy.
+        :param beam_width: The number of hypotheses kept by the beam decoder.
         :return: A sequence of part-of-speech tags, one for each token.
         """
-        _, pos_tags = self.predict_greedy(tokens)
-        # _, _, pos_tags = self.predict_viterbi(tokens)
+        if decoder == "greedy":
+            _, pos_tags = self.predict_greedy(tokens)
+        elif decoder == "beam":
+            _, pos_tags = self.predict_beam(tokens, beam_width)
+        elif decoder == "viterbi":
+            _, _, pos_tags = self.predict_viterbi(tokens)
+        else:
+            raise ValueError("unknown decoder: {}".format(decoder))
         return pos_tags
 
     def predict_greedy(self, tokens: TokenSeq) -> Tuple[NDArray, PosSeq]:
@@ -212,6 +225,55 @@ class Classifier(object):
 
 
 
+    def predict_beam(self, tokens: TokenSeq, beam_width=4) -> Tuple[float, PosSeq]:
+        """Predicts part-of-speech tags for the sequence of tokens using beam
+        search, and returns the log-probability of the predicted tags and the
+        tags themselves.
+
+        Only the beam_width most probable tag sequences are kept after each
+        token, and all of them are extended with the next token's tags in one
+        call to the classifier. A beam width of 1 is the greedy algorithm, and
+        wider beams approach the Viterbi algorithm.
+
+        :param tokens: A sequence of tokens representing a sentence.
+        :param beam_width: The number of tag sequences kept after each token.
+        :return: The log-probability of the predicted tags, and the sequence of
+        predicted part-of-speech tags (one for each input token).
+        """
+        if beam_width < 1:
+            raise ValueError("beam_width must be at least 1")
+        nTags=len(self.encoder.classes_)
+        vocabulary=self.vectorizer.vocabulary_
+        previousColumns=self._previous_tag_columns()
+        #the score and last tag of each hypothesis, starting from <s>
+        beamScores=np.zeros(1)
+        beamTags=np.array([nTags], dtype=np.intp)
+        #the last tag of each hypothesis, and the hypothesis it extended,
+        #after each token
+        history=[]
+        for token in tokens:
+            tokenColumns=np.full(len(beamTags), vocabulary.get("token=" + token, -1), dtype=np.intp)
+            features=_feature_rows(tokenColumns, previousColumns[beamTags], len(vocabulary))
+            #score of each (hypothesis, tag) pair
+            pathScores=(beamScores[:, np.newaxis] + self.logisticRegr.predict_log_proba(features)).ravel()
+            best=np.arange(len(pathScores))
+            if len(pathScores) > beam_width:
+                best=np.argpartition(-pathScores, beam_width - 1)[:beam_width]
+            best=best[np.argsort(-pathScores[best], kind="stable")]
+            beamScores=pathScores[best]
+            extended, beamTags=np.divmod(best, nTags)
+            history.append((beamTags, extended))
+        if not history:
+            return (0.0, [])
+        #follow the best hypothesis back to the first token
+        tagIndices=np.empty(len(tokens), dtype=np.intp)
+        hypothesis=0
+        for i in range(len(tokens) - 1, -1, -1):
+            tags, extended=history[i]
+            tagIndices[i]=tags[hypothesis]
+            hypothesis=extended[hypothesis]
+        return (float(beamScores[0]), list(self.encoder.inverse_transform(tagIndices)))
+
     def predict_viterbi(self, tokens: TokenSeq) -> Tuple[NDArray, NDArray, PosSeq]:
         """Predicts part-of-speech tags for the sequence of tokens using the
         Viterbi algorithm, and returns the transition probability tensor,
@@ -236,3 +298,111 @@ class Classifier(object):
         :return: The transition probability tensor, the Viterbi lattice, and the
         sequence of predicted part-of-speech tags (one for each input token).
         """
+        nTags=len(self.encoder.classes_)
+        #log-probabilities of every tag of every token, after every previous tag
+        if len(tokens) == 0:
+            return (np.empty((0, nTags + 1, nTags)), np.empty((0, nTags)), [])
+        transitionProbs=self.logisticRegr.predict_log_proba(
+            self.transition_features(tokens)).reshape(len(tokens), nTags + 1, nTags)
+        viterbiLattice=np.empty((len(tokens), nTags))
+        #the best previous tag of each token and tag
+        backPointers=np.empty((len(tokens), nTags), dtype=np.intp)
+        #the first token can only follow <s>, the last entry
+        viterbiLattice[0]=transitionProbs[0, nTags]
+        for i in range(1, len(tokens)):
+            #score of each (previous tag, tag) pair
+            pathScores=viterbiLattice[i - 1][:, np.newaxis] + transitionProbs[i, :nTags]
+            backPointers[i]=np.argmax(pathScores, axis=0)
+            viterbiLattice[i]=pathScores[backPointers[i], np.arange(nTags)]
+        #follow the best previous tags back from the best last tag
+        tagIndices=np.empty(len(tokens), dtype=np.intp)
+        tagIndices[-1]=np.argmax(viterbiLattice[-1])
+        for i in range(len(tokens) - 1, 0, -1):
+            tagIndices[i - 1]=backPointers[i, tagIndices[i]]
+        return (transitionProbs, viterbiLattice, list(self.encoder.inverse_transform(tagIndices)))
+
+    def transition_features(self, tokens: TokenSeq) -> NDArray:
+        """Returns the feature matrix of every token after every possible
+        previous part-of-speech tag.
+
+        Row i * (T + 1) + j, where T is the number of part-of-speech tags, has
+        the features of token i when the previous tag is tag j, or "<s>" when j
+        is T. The rows are built directly from the vectorizer's vocabulary, and
+        are the same as those `predict_greedy` would produce.
+
+        :param tokens: A sequence of tokens representing a sentence.
+        :return: A feature matrix with (T + 1) rows per token.
+        """
+        vocabulary=self.vectorizer.vocabulary_
+        previousColumns=self._previous_tag_columns()
+        #the column of each token, or -1 if it is unknown
+        tokenColumns=np.array([vocabulary.get("token=" + token, -1) for token in tokens], dtype=np.intp)
+        rowTokens, rowPrevious=np.divmod(np.arange(len(tokens) * len(previousColumns)), len(previousColumns))
+        return _feature_rows(tokenColumns[rowTokens], previousColumns[rowPrevious], len(vocabulary))
+
+    def _previous_tag_columns(self) -> np.ndarray:
+        """Returns the column of each previous tag feature, with "<s>" last, or
+        -1 for tags that never preceded a token in training.
+        """
+        vocabulary=self.vectorizer.vocabulary_
+        return np.array([vocabulary.get("pos-1=" + tag, -1) for tag in
+                         list(self.encoder.classes_) + ["<s>"]], dtype=np.intp)
+
+
+def _feature_rows(token_columns: np.ndarray, previous_columns: np.ndarray, n_features: int) -> NDArray:
+    """Builds a feature matrix whose row i has a 1 in token_columns[i] and in
+    previous_columns[i], where -1 is an unknown feature and is left out, as
+    DictVectorizer.transform does.
+    """
+    rows=np.tile(np.arange(len(token_columns)), 2)
+    columns=np.concatenate([token_columns, previous_columns])
+    known=columns >= 0
+    return csr_matrix((np.ones(np.count_nonzero(known)), (rows[known], columns[known])),
+                      shape=(len(token_columns), n_features))
+
+
+def evaluate(classifier: Classifier,
+             tagged_sentences: Iterable[Tuple[TokenSeq, PosSeq]],
+             decoder="viterbi",
+             beam_width=4) -> Dict:
+    """Measures the accuracy and speed of a decoder on tagged sentences.
+
+    :param classifier: A trained classifier.
+    :param tagged_sentences: The sentences, with their correct tags.
+    :param decoder: "greedy", "beam" or "viterbi", as for `Classifier.predict`.
+    :param beam_width: The number of hypotheses kept by the beam decoder.
+    :return: A dict with the tagging "accuracy" and the "tokens_per_second".
+    """
+    totalCount=0
+    correctCount=0
+    seconds=0.0
+    for tokens, posTags in tagged_sentences:
+        start=time.perf_counter()
+        predictedTags=classifier.predict(tokens, decoder, beam_width)
+        seconds+=time.perf_counter() - start
+        totalCount+=len(tokens)
+        correctCount+=sum(predicted == true for predicted, true in zip(predictedTags, posTags))
+    return {"accuracy": correctCount / totalCount if totalCount else 0.0,
+            "tokens_per_second": totalCount / seconds if seconds else 0.0}
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> None:
+    parser=argparse.ArgumentParser(description="Compares the accuracy and speed of the MEMM decoders.")
+    parser.add_argument("--train", default="PTBSmall/train.tagged", help="a .tagged file to train on")
+    parser.add_argument("--dev", default="PTBSmall/dev.tagged", help="a .tagged file to evaluate on")
+    parser.add_argument("--sentences", type=int, help="evaluate only this many dev sentences")
+    parser.add_argument("--beam-widths", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args=parser.parse_args(argv)
+    classifier=Classifier()
+    classifier.train(read_ptbtagged(args.train))
+    devSentences=list(itertools.islice(read_ptbtagged(args.dev), args.sentences))
+    decoders=[("greedy", "greedy", 0)] + [("beam " + str(width), "beam", width) for width in args.beam_widths]
+    decoders.append(("viterbi", "viterbi", 0))
+    print("{:<10} {:>9} {:>11}".format("decoder", "accuracy", "tokens/sec"))
+    for name, decoder, beamWidth in decoders:
+        result=evaluate(classifier, devSentences, decoder, beamWidth)
+        print("{:<10} {:>9.2%} {:>11.0f}".format(name, result["accuracy"], result["tokens_per_second"]))
+
+
+if __name__ == "__main__":
+    main()
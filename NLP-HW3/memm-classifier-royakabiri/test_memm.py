@@ -110,7 +110,6 @@ def test_accuracy(capsys):
     assert accuracy >= 0.93
 
 
-@pytest.mark.xfail
 def test_predict_viterbi():
     classifier = memm.Classifier()
     ptb_train = memm.read_ptbtagged("PTBSmall/train.tagged")
@@ -184,3 +183,52 @@ def test_predict_viterbi():
             for index3 in range(n_tags)
             for index4 in range(n_tags)
             for index5 in range(n_tags)))
+
+
+def test_predict_beam():
+    classifier = memm.Classifier()
+    ptb_train = memm.read_ptbtagged("PTBSmall/train.tagged")
+    ptb_train = itertools.islice(ptb_train, 2)  # just the 1st 2 sentences
+    classifier.train(ptb_train)
+    n_tags = len(classifier.encoder.classes_)
+
+    tokens = "Vinken is a director .".split()
+    trans_probs, viterbi_lattice, viterbi_tags = classifier.predict_viterbi(tokens)
+
+    def path_score(pos_tags):
+        pos_indexes = [classifier.label_index(t) for t in pos_tags]
+        return sum(trans_probs[i, pos_indexes[i - 1] if i else n_tags, pos_index]
+                   for i, pos_index in enumerate(pos_indexes))
+
+    # a beam of one hypothesis is the greedy algorithm
+    score, pos_tags = classifier.predict_beam(tokens, beam_width=1)
+    assert pos_tags == classifier.predict_greedy(tokens)[1]
+    np.testing.assert_almost_equal(score, path_score(pos_tags))
+
+    # wider beams never score worse, and a beam that keeps every path finds
+    # the Viterbi path
+    scores = [classifier.predict_beam(tokens, beam_width=width)[0]
+              for width in [1, 2, 4, 8, n_tags ** (len(tokens) - 1)]]
+    assert all(np.diff(scores) >= -1e-9)
+    np.testing.assert_almost_equal(scores[-1], np.max(viterbi_lattice[-1]))
+    assert classifier.predict(tokens, "beam", n_tags ** (len(tokens) - 1)) == viterbi_tags
+
+    # predict chooses the decoder
+    assert classifier.predict(tokens, "greedy") == pos_tags
+    assert classifier.predict(tokens) == viterbi_tags
+    assert classifier.predict([], "beam") == classifier.predict([]) == []
+    with pytest.raises(ValueError):
+        classifier.predict(tokens, "exhaustive")
+
+
+def test_evaluate():
+    classifier = memm.Classifier()
+    ptb_train = memm.read_ptbtagged("PTBSmall/train.tagged")
+    classifier.train(itertools.islice(ptb_train, 100))
+    ptb_dev = list(itertools.islice(memm.read_ptbtagged("PTBSmall/dev.tagged"), 20))
+
+    results = {decoder: memm.evaluate(classifier, ptb_dev, decoder, beam_width=4)
+               for decoder in ["greedy", "beam", "viterbi"]}
+    for result in results.values():
+        assert 0.5 < result["accuracy"] <= 1
+        assert result["tokens_per_second"] > 0